@@ -3,7 +3,7 @@ from tkinter import ttk, messagebox
 import hashlib
 import database as db
 import customwidgets as cw
-import algorithm
+import jobs
 import re
 from abc import abstractmethod
 
@@ -756,25 +756,64 @@ class StudentSubjectNode:
 
 
 class ProgressWindow(tk.Toplevel):
-    """Window shown when back-ground process is going on"""
-    def __init__(self, parent, title="Progress", text="Working...", process=None):
+    """Window shown while a job runs in a back-ground process. The job's events are polled with after,
+    so the rest of the program stays responsive"""
+    POLL_MS = 100
+
+    def __init__(self, parent, title="Progress", text="Working...", job=None, args=(), on_done=None,
+                 on_cancelled=None):
         super().__init__(parent)
         self.transient(parent)
         self.grab_set()
         self.title(title)
+        self.protocol("WM_DELETE_WINDOW", self.cancel)
+        self.on_done = on_done
+        self.on_cancelled = on_cancelled
         self.msg_lbl = tk.Label(self, text=text)
-        self.msg_lbl.grid(row=0, column=0)
-        self.mainloop()
-        self._start_process(process)
+        self.msg_lbl.grid(row=0, column=0, padx=10, pady=5)
+        self.progress_bar = ttk.Progressbar(self, mode="indeterminate", length=250)
+        self.progress_bar.grid(row=1, column=0, padx=10)
+        self.progress_bar.start()
+        self.progress_lbl = tk.Label(self, text="")
+        self.progress_lbl.grid(row=2, column=0, padx=10)
+        self.cancel_btn = ttk.Button(self, text="Cancel", command=self.cancel)
+        self.cancel_btn.grid(row=3, column=0, pady=5)
+        self.runner = jobs.JobRunner()
+        self.runner.start(job, m_db.filepath, *args)
+        self.after(self.POLL_MS, self._poll)
+
+    def _poll(self):
+        """Shows the events of the job, until it ends"""
+        for kind, data in self.runner.poll():
+            if kind == "phase":
+                self.msg_lbl.config(text=data + "...")
+            elif kind == "progress":
+                self.progress_bar.stop()
+                self.progress_bar.config(mode="determinate", maximum=max(data["total"], 1), value=data["done"])
+                text = "%d of %d" % (data["done"], data["total"])
+                if data["nodes"]:
+                    text += " (%d nodes searched)" % data["nodes"]
+                self.progress_lbl.config(text=text)
+            else:
+                self._finish(kind, data)
+                return
+        self.after(self.POLL_MS, self._poll)
 
-    def _start_process(self, process):
-        """Executes the process given and passes in arguments"""
-        try:
-            process(self)
-        except:
-            pass
-        finally:
-            self.destroy()
+    def _finish(self, kind, data):
+        """Closes the window once the job has ended"""
+        self.destroy()
+        if kind == "error":
+            messagebox.showerror("Error", data)
+        elif kind == "done" and self.on_done is not None:
+            self.on_done(data)
+        elif kind == "cancelled" and self.on_cancelled is not None:
+            self.on_cancelled()
+
+    def cancel(self):
+        """Asks the job to stop, the window closes when it has"""
+        self.cancel_btn.config(state="disabled")
+        self.msg_lbl.config(text="Cancelling...")
+        self.runner.cancel()
 
 
 class ImportSubjectWindow(tk.Toplevel):
@@ -1823,16 +1862,28 @@ class EditTimetablePage(tk.Frame):
         self.clss_btn = self.bottom_bar.add_button(text="Create Classes",
                                                    command=self._create_class_window)
         self.timetable_btn = self.bottom_bar.add_button(text="Create Timetable",
-                                                        command=None)
+                                                        command=self._create_timetable_window)
         self.bottom_bar.grid(row=1)
 
     def _create_class_window(self):
-        """Needs work..."""
-
-        def process(window):
-            algorithm.Classes(m_db).create_classes()
-            window.destroy()
-        ProgressWindow(self.controller, title="Classes", process=process)
+        """Creates the classes in a back-ground process"""
+        ProgressWindow(self.controller, title="Classes", text="Creating classes...", job=jobs.create_classes,
+                       on_done=lambda result: self.refresh_all(), on_cancelled=self._classes_cancelled)
+
+    def _classes_cancelled(self):
+        messagebox.showinfo("Classes", "Creating classes was cancelled.\n"
+                                       "The classes of the years already finished have been kept.")
+        self.refresh_all()
+
+    def _create_timetable_window(self):
+        """Solves the timetable in a back-ground process and saves it"""
+        ProgressWindow(self.controller, title="Timetable", text="Creating timetable...", job=jobs.create_timetable,
+                       on_done=self._timetable_created)
+
+    def _timetable_created(self, solved):
+        if not solved:
+            messagebox.showinfo("Timetable", "No timetable meets the current requirements")
+        self.refresh_all()
 
     def tab_handler(self, event):
         clicked_tab = self.tab_controller.tk.call(self.tab_controller._w, "identify", "tab", event.x, event.y)
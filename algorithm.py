@@ -12,12 +12,15 @@ class Classes:
         self.db = database
         self.cls_num = 0
 
-    def create_classes(self):
-        """Central call point of the algorithm"""
+    def create_classes(self, on_year=None):
+        """Central call point of the algorithm, on_year is called with the number of years done and
+        the number of years after each year"""
         print("Called")
         yr_ids = self.db.get_all_year_ids()
-        for yr_id in yr_ids:
+        for num, yr_id in enumerate(yr_ids, 1):
             self._create_classes_year(yr_id)
+            if on_year is not None:
+                on_year(num, len(yr_ids))
 
     def _compare_existing_classes(self, yr_id, sbjt_id, req_sets_clss):
         """Compares with the classes that are already existing"""
@@ -1,7 +1,11 @@
-from typing import Generic, TypeVar, Dict, List, Set, Optional
+from typing import Generic, TypeVar, Callable, Dict, Hashable, List, Set, Tuple, Optional, Iterator, Sequence
 from abc import ABC, abstractmethod
-import copy
-from random import choice
+from collections import deque, OrderedDict
+from random import choice, Random
+from timeit import default_timer as timer
+from variableordering import VariableOrdering, create_ordering
+from searchstats import SearchStats
+from matching import hopcroft_karp, inconsistent_edges
 
 
 V = TypeVar("V")
@@ -37,7 +41,7 @@ class Stack(list):
         return self._size == 0
 
 
-class Queue(list):
+class Queue(deque):
     """First in, first out data structure"""
     def __init__(self) -> None:
         super().__init__()
@@ -48,17 +52,248 @@ class Queue(list):
 
     def dequeue(self) -> object:
         """Removes and returns first item in the queue"""
-        return self.pop(0)
+        return self.popleft()
 
     def first(self) -> object:
         """Returns value of first item in queue"""
+        return self[0]
 
     def last(self) -> object:
         """Returns value of last item in queue"""
+        return self[-1]
+
+
+class ArcQueue(Queue):
+    """Queue of arcs which ignores arcs that are already waiting to be revised"""
+    def __init__(self) -> None:
+        super().__init__()
+        self.pending: Set[tuple] = set()
+
+    def enqueue(self, arc: tuple) -> None:
+        """Places arc in the queue unless it is already pending"""
+        if arc not in self.pending:
+            self.pending.add(arc)
+            self.append(arc)
+
+    def dequeue(self) -> tuple:
+        """Removes and returns the first arc so it can be queued again"""
+        arc = self.popleft()
+        self.pending.discard(arc)
+        return arc
+
+
+class RandomSet(Generic[V]):
+    """Set with O(1) add, remove and random choice, items are kept in a list with their positions"""
+    def __init__(self) -> None:
+        self.items: List[V] = []
+        self.positions: Dict[V, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, item: V) -> bool:
+        return item in self.positions
+
+    def add(self, item: V) -> None:
+        """Adds item if it is not already present"""
+        if item not in self.positions:
+            self.positions[item] = len(self.items)
+            self.items.append(item)
+
+    def discard(self, item: V) -> None:
+        """Removes item by moving the last item into its place"""
+        position = self.positions.pop(item, None)
+        if position is None:
+            return
+        last = self.items.pop()
+        if position < len(self.items):
+            self.items[position] = last
+            self.positions[last] = position
+
+    def choice(self, rng: Random) -> V:
+        """Returns a random item"""
+        return self.items[rng.randrange(len(self.items))]
+
+
+class DisjointSet(Generic[V]):
+    """Union-find forest with union by size and path halving"""
+    def __init__(self, items: Sequence[V] = ()) -> None:
+        self.parent: Dict[V, V] = {}
+        self.size: Dict[V, int] = {}
+        for item in items:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    def add(self, item: V) -> None:
+        """Adds item as a set of its own if it is not already present"""
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+
+    def find(self, item: V) -> V:
+        """Returns the root of the set containing item"""
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, item1: V, item2: V) -> V:
+        """Merges the sets containing both items, returns the root of the merged set"""
+        root1, root2 = self.find(item1), self.find(item2)
+        if root1 == root2:
+            return root1
+        if self.size[root1] < self.size[root2]:
+            root1, root2 = root2, root1
+        self.parent[root2] = root1
+        self.size[root1] += self.size.pop(root2)
+        return root1
+
+
+class ListDomain(list):
+    """Domain stored as a list, values keep their order when pruned and restored"""
+    def copy(self) -> "ListDomain":
+        """Returns an independent domain with the same values"""
+        return ListDomain(self)
+
+    def discard(self, value: D) -> int:
+        """Removes value and returns its index so it can be restored in place"""
+        index = self.index(value)
+        del self[index]
+        return index
+
+    def restore(self, value: D, index: int) -> None:
+        """Puts a discarded value back at the index it was removed from"""
+        self.insert(index, value)
+
+
+class BitsetDomain(Generic[D]):
+    """Domain stored as a bitmask over a fixed tuple of values, membership, removal and size are O(1)"""
+    def __init__(self, values: Sequence[D], index: Dict[D, int] = None) -> None:
+        self.values: Tuple[D, ...] = tuple(values)  # shared between copies, bit i stands for values[i]
+        self.index: Dict[D, int] = index if index is not None else {val: i for i, val in enumerate(self.values)}
+        self.mask: int = (1 << len(self.values)) - 1
+        self.size: int = len(self.values)
+
+    def __repr__(self) -> str:
+        return "BitsetDomain(" + str(list(self)) + ")"
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, value: D) -> bool:
+        bit = self.index.get(value)
+        return bit is not None and bool(self.mask >> bit & 1)
+
+    def __iter__(self) -> Iterator[D]:
+        """Yields values in their original order, safe to prune while iterating"""
+        mask, values = self.mask, self.values
+        while mask:
+            low = mask & -mask
+            yield values[low.bit_length() - 1]
+            mask ^= low
+
+    def bit(self, value: D) -> int:
+        """Position of value within the shared values, used to look up constraint table rows"""
+        return self.index[value]
+
+    def copy(self) -> "BitsetDomain":
+        """Returns an independent domain sharing the same values and index"""
+        domain = BitsetDomain.__new__(BitsetDomain)
+        domain.values, domain.index, domain.mask, domain.size = self.values, self.index, self.mask, self.size
+        return domain
+
+    def remove(self, value: D) -> None:
+        """Removes value from the domain, raises ValueError if it is not present"""
+        if value not in self:
+            raise ValueError("Value not in domain")
+        self.discard(value)
+
+    def discard(self, value: D) -> int:
+        """Clears the bit of value and returns it so it can be restored"""
+        bit = 1 << self.index[value]
+        self.mask &= ~bit
+        self.size -= 1
+        return bit
+
+    def restrict(self, mask: int) -> int:
+        """Keeps only the values set in mask and returns the bits that were cleared"""
+        removed = self.mask & ~mask
+        self.mask ^= removed
+        self.size -= bin(removed).count("1")
+        return removed
+
+    def restore(self, value: Optional[D], bits: int) -> None:
+        """Sets the bits cleared by discard or restrict again"""
+        self.mask |= bits
+        self.size += 1 if value is not None else bin(bits).count("1")
+
+
+class ChoicePoint(Generic[V, D]):
+    """A variable on the search stack with the values still to be tried"""
+    def __init__(self, variable: V, values: List[D]) -> None:
+        self.variable = variable
+        self.values = values
+        self.position = 0  # index of the next value to try
+        self.assigned = False  # True while values[position - 1] is assigned
+
+    def __repr__(self) -> str:
+        return "CP:" + str(self.variable) + str(self.values[self.position:])
+
+
+class NogoodStore(Generic[V, D]):
+    """Partial assignments known to have no solution, the least recently used is evicted once full"""
+    def __init__(self, capacity: int = 10000, max_length: int = 20) -> None:
+        self.capacity = capacity  # most nogoods kept at once
+        self.max_length = max_length  # longer nogoods are rarely matched again so are not stored
+        self.nogoods: OrderedDict = OrderedDict()  # frozenset of (variable, value) literals in order of use
+        self.watches: Dict[Tuple[V, D], List[frozenset]] = {}  # nogoods containing each literal
+        self.num_hits = 0
+
+    def __len__(self) -> int:
+        return len(self.nogoods)
+
+    def add(self, partial_assignment: Dict[V, D]) -> None:
+        """Stores the partial assignment as a nogood"""
+        if len(partial_assignment) > self.max_length:
+            return
+        nogood = frozenset(partial_assignment.items())
+        if nogood in self.nogoods:
+            self.nogoods.move_to_end(nogood)
+            return
+        if len(self.nogoods) >= self.capacity:
+            self._evict()
+        self.nogoods[nogood] = None
+        for literal in nogood:
+            self.watches.setdefault(literal, []).append(nogood)
+
+    def _evict(self) -> None:
+        """Removes the least recently used nogood"""
+        nogood, _ = self.nogoods.popitem(last=False)
+        for literal in nogood:
+            self.watches[literal].remove(nogood)
+            if not self.watches[literal]:
+                del self.watches[literal]
+
+    def violated(self, var: V, val: D, assignment: Dict[V, D]) -> Optional[frozenset]:
+        """Returns a nogood that assigning val to var would complete, None if there is none"""
+        for nogood in self.watches.get((var, val), ()):
+            if all(variable == var or (variable in assignment and assignment[variable] == value)
+                   for variable, value in nogood):
+                self.num_hits += 1
+                self.nogoods.move_to_end(nogood)
+                return nogood
+        return None
 
 
 class Constraint(Generic[V, D], ABC):
     """Framework for a constraint"""
+    static: bool = False  # True if satisfied never reads the assignment, so it can be compiled into tables
+    pairwise: bool = True  # False if propagate and conflicts enforce it, then its variables do not become neighbours
+    symmetric: bool = False  # True if it treats every order of its variables alike
+
     def __init__(self, variables: List[V]) -> None:
         self.variables = variables
 
@@ -82,54 +317,198 @@ class UnaryConstraint(Generic[V, D], ABC):
         ...
 
 
-class BinaryConstraint(Generic[V, D], ABC):
-    """Framework for a unary constraint"""
+class BinaryConstraint(Constraint[V, D], ABC):
+    """Framework for a constraint between exactly two variables, which can be compiled into a table"""
+    static = True
+
     def __init__(self, variables: List[V]) -> None:
-        self.variables = variables
+        if len(variables) != 2:
+            raise ValueError("A binary constraint must have exactly two variables")
+        super().__init__(variables)
+
+    def satisfied(self, var1: V, val1: D, var2: V, val2: D, assignment: Dict[V, D]) -> bool:
+        """Checks the values against each other if the pair of variables is the one constrained"""
+        first, second = self.variables
+        if var1 == first and var2 == second:
+            return self.compatible(val1, val2)
+        if var1 == second and var2 == first:
+            return self.compatible(val2, val1)
+        return True
 
     @abstractmethod
-    def satisfied(self, val1: D, val2: D) -> bool:
-        """Needs to be overwritten to create a custom constraint"""
+    def compatible(self, val1: D, val2: D) -> bool:
+        """Needs to be overwritten to create a custom constraint, val1 belongs to the first variable"""
         ...
 
 
+class LessEqualConstraint(BinaryConstraint[V, D]):
+    """The first variable takes a value no greater than the second, used to order interchangeable variables"""
+    def compatible(self, val1: D, val2: D) -> bool:
+        return val1 <= val2
+
+
+class GlobalConstraint(Constraint[V, D], ABC):
+    """Framework for an n-ary constraint with its own propagator. satisfied still checks pairs of values,
+    propagate prunes the values that pairwise arc consistency cannot rule out"""
+    idempotent: bool = False  # one call reaches a fixpoint, so its own prunings need not run it again
+
+    @abstractmethod
+    def propagate(self, csp: "CSP[V, D]", assignment: Dict[V, D]) -> bool:
+        """Needs to be overwritten to prune csp.current_domains with csp._prune, returns False if the
+        constraint can no longer be satisfied"""
+        ...
+
+    def conflicts(self, var: V, val: D, assignment: Dict[V, D]) -> List[V]:
+        """Returns the other assigned variables that rule out var=val, empty if there are none. Searches
+        without forward checking rely on it for a constraint that is not pairwise"""
+        return []
+
+
+class AllDifferentConstraint(GlobalConstraint[V, D]):
+    """Every variable takes a different value. Propagation matches the variables to the values of their
+    domains and removes every value that is in no such matching (Regin), so a group of variables sharing
+    fewer values than there are variables fails as soon as it is propagated"""
+    static = True
+    symmetric = True
+    idempotent = True  # every value left is in a maximum matching
+
+    def __init__(self, variables: List[V]) -> None:
+        super().__init__(variables)
+        self.scope: Set[V] = set(variables)
+        self.matching: Dict[V, D] = {}  # last matching found, the next one starts from it
+
+    def satisfied(self, var1: V, val1: D, var2: V, val2: D, assignment: Dict[V, D]) -> bool:
+        return var2 not in self.scope or val1 != val2
+
+    def propagate(self, csp: "CSP[V, D]", assignment: Dict[V, D]) -> bool:
+        adjacency = {var: (assignment[var],) if var in assignment else csp.current_domains[var]
+                     for var in self.variables}
+        matching: Dict[V, D] = hopcroft_karp(adjacency, self.matching)
+        if len(matching) < len(self.variables):
+            return False
+        self.matching = matching
+        for var, val in inconsistent_edges(adjacency, matching):
+            csp._prune(var, val)
+        return True
+
+
 class CSP(Generic[V, D]):
     """Constraint satisfaction framework stores variables, domains and constraints"""
-    def __init__(self) -> None:
+    def __init__(self, domain_type: type = ListDomain) -> None:
         self.num_backtracks, self.num_assigns = 0, 0
+        self.num_revisions, self.num_checks = 0, 0  # arc consistency statistics
         self.mcv, self.fc = False, False
+        self.ordering: Optional[VariableOrdering[V]] = None  # heap of variables used instead of a random choice
+        self.rng: Optional[Random] = None  # random variable choices without an ordering, the random module if None
+        self.domain_type: type = domain_type  # ListDomain or BitsetDomain, used for current_domains
         self.variables: List[V] = []
         self.domains: Dict[V, List[D]] = {}
         self.constraints: Dict[V, List[Constraint[V, D]]] = {}
+        self.global_constraints: List[GlobalConstraint[V, D]] = []  # propagated after arc consistency
+        self.propagators: Dict[V, List[GlobalConstraint[V, D]]] = {}  # global constraints on each variable
         self.neighbours: Dict[V, Set[V]] = {}
         self.initial_assignment: Dict[V, D] = {}
-        self.current_domains: Dict[V, List[D]] = {}
-        self.current_domain_stack = Stack()
+        self.preferred: Dict[V, D] = {}  # value tried first for each variable, the previous solution when repairing
+        self.current_domains: Dict[V, ListDomain] = {}
+        self.trail: List[Tuple[V, D, int]] = []  # undo log of (variable, value, position) for every pruned value
+        self.trail_marks = Stack()  # length of the trail when each assignment was made
+        self.residues: Dict[Tuple[V, V], Dict[D, D]] = {}  # last support found for each value on each arc
+        self.tables: Dict[Tuple[V, V], List[int]] = {}  # compiled arcs, row i is the mask of supports of bit i
+        self.choice_points = Stack()  # search stack of the iterative search, one ChoicePoint per assigned variable
+        self.search_assignment: Dict[V, D] = {}
+        self.paused, self.finished = False, False
+        self.cbj = False  # conflict-directed backjumping
+        self.conflict_sets: Dict[V, Set[V]] = {}  # assigned variables that ruled out values of each choice point
+        self.pruned_by: Dict[V, List[V]] = {}  # assigned variables whose forward checking pruned each variable
+        self.reductions: Dict[V, List[V]] = {}  # variables pruned by forward checking each assigned variable
+        self.nogoods: Optional[NogoodStore[V, D]] = None
+        self.stats = SearchStats()  # set stats.enabled to collect search statistics
 
     def set_domains(self, variables: List[V], domains: Dict[V, List[D]]):
         """Sets the domains of the CSP"""
         self.variables = variables or domains.keys()
         self.domains = domains
+        self.global_constraints = []
         for variable in self.variables:
             self.constraints[variable] = []
+            self.propagators[variable] = []
             self.neighbours[variable] = set()
             if variable not in self.domains:
                 raise LookupError("Every variable should have a domain assigned to it")
 
-    def _assign(self, variable: V, value: D, assignment: Dict[V, D]) -> None:
-        """Adds to assignment and discards old value. Bookkeeping for current_domains and num_assigns"""
+    def _assign(self, variable: V, value: D, assignment: Dict[V, D]) -> bool:
+        """Adds to assignment and discards old value. Bookkeeping for current_domains and num_assigns.
+        Returns False if propagation wipes out a domain"""
         self.num_assigns += 1
         assignment[variable] = value
+        if self.stats.enabled:
+            self.stats.node(len(assignment), self)
         if self.fc:
-            self.current_domain_stack.push(copy.deepcopy(self.current_domains))
-            self._forward_check(variable, value, self.current_domains, assignment)
-            self._AC3([(var, variable) for var in self.neighbours[variable]])
+            self.trail_marks.push(len(self.trail))
+            if not self.stats.enabled:
+                return self._propagate(variable, value, assignment)
+            start: float = timer()
+            consistent: bool = self._propagate(variable, value, assignment)
+            self.stats.propagation_time += timer() - start
+            return consistent
+        return True
 
-    @staticmethod
-    def _unassign(variable: V, assignment: Dict[V, D]) -> None:
+    def _propagate(self, variable: V, value: D, assignment: Dict[V, D]) -> bool:
+        """Forward checks variable=value, restores arc consistency around it and propagates the global
+        constraints on the variables it changed"""
+        self._forward_check(variable, value, self.current_domains, assignment)
+        if not self._AC3([(var, variable) for var in self.neighbours[variable]]):
+            return False
+        if not self.global_constraints:
+            return True
+        changed: Set[V] = {entry[0] for entry in self.trail[self.trail_marks.top():]}  # pruned since the assignment
+        changed.add(variable)
+        return self._propagate_global_constraints(assignment, changed)
+
+    def _propagate_global_constraints(self, assignment: Dict[V, D], changed: Set[V] = None) -> bool:
+        """Runs the global propagators on the variables in changed, or all of them, until none removes a
+        value. Arc consistency follows each propagator that prunes, then the propagators on the variables
+        pruned are queued. Returns False if a constraint can no longer be satisfied"""
+        if not self.global_constraints:
+            return True
+        queue: Queue = Queue()
+        queued: Set[int] = set()  # ids of the constraints waiting in queue
+
+        def enqueue(constraint: GlobalConstraint[V, D]) -> None:
+            if id(constraint) not in queued:
+                queued.add(id(constraint))
+                queue.enqueue(constraint)
+
+        for constraint in (self.global_constraints if changed is None else
+                           [constraint for variable in changed for constraint in self.propagators[variable]]):
+            enqueue(constraint)
+        while queue:
+            constraint: GlobalConstraint[V, D] = queue.dequeue()
+            queued.discard(id(constraint))
+            mark: int = len(self.trail)
+            if not constraint.propagate(self, assignment):
+                if self.ordering is not None:
+                    self.ordering.failure(*constraint.variables)
+                return False
+            if len(self.trail) == mark:
+                continue
+            pruned: Set[V] = {entry[0] for entry in self.trail[mark:]}
+            revised: int = len(self.trail)
+            if not self._AC3([(var, variable) for variable in pruned for var in self.neighbours[variable]]):
+                return False
+            reduced: Set[V] = {entry[0] for entry in self.trail[revised:]}  # pruned by arc consistency
+            for variable in pruned | reduced:
+                for other in self.propagators[variable]:
+                    if other is not constraint or not constraint.idempotent or variable in reduced:
+                        enqueue(other)
+        return True
+
+    def _unassign(self, variable: V, assignment: Dict[V, D]) -> None:
         """Backtrack by removing the value set to a variable in assignment"""
         if variable in assignment:
             del assignment[variable]
+            if self.ordering is not None:
+                self.ordering.touch(variable)
 
     def _num_conflicts(self, var: V, val: D, assignment: Dict[V, D]) -> int:
         """Return the number of conflicts var=val with other variables already assigned"""
@@ -138,13 +517,44 @@ class CSP(Generic[V, D]):
             value: Optional[D] = assignment.get(variable, None)
             if value is not None and not self._constraints_satisfied(var, val, variable, value, assignment):
                 num_conflicts += 1
+        for constraint in self.propagators[var]:
+            if not constraint.pairwise and constraint.conflicts(var, val, assignment):
+                num_conflicts += 1
         return num_conflicts
 
     def _backtrack_domains(self) -> None:
-        """Backtrack by removing items of the stack to reflect recursion depth"""
+        """Backtrack by undoing the prunings made since the last assignment"""
         self.num_backtracks += 1
+        if self.stats.enabled:
+            self.stats.backtrack(self)
         if self.fc:
-            self.current_domains = self.current_domain_stack.pop_item()
+            self._undo_trail(self.trail_marks.pop_item())
+
+    def _prune(self, variable: V, value: D) -> None:
+        """Removes a value from the current domain of a variable and records it on the trail"""
+        self.trail.append((variable, value, self.current_domains[variable].discard(value)))
+        if self.stats.enabled:
+            self.stats.prunings += 1
+        if self.ordering is not None:
+            self.ordering.touch(variable)
+
+    def _restrict(self, variable: V, mask: int) -> None:
+        """Keeps only the values of a bitset domain set in mask, recording the removed bits on the trail"""
+        removed: int = self.current_domains[variable].restrict(mask)
+        if removed:
+            self.trail.append((variable, None, removed))
+            if self.stats.enabled:
+                self.stats.prunings += bin(removed).count("1")
+            if self.ordering is not None:
+                self.ordering.touch(variable)
+
+    def _undo_trail(self, mark: int) -> None:
+        """Restores every value pruned since the trail was at length mark, most recent first"""
+        while len(self.trail) > mark:
+            variable, value, position = self.trail.pop()
+            self.current_domains[variable].restore(value, position)
+            if self.ordering is not None:
+                self.ordering.touch(variable)
 
     def add_constraint(self, constraint: Constraint[V, D]) -> None:
         """Adds the constraint to all the variables specified in the constraint"""
@@ -153,43 +563,197 @@ class CSP(Generic[V, D]):
                 raise LookupError("Variable in constraint not in CSP")
             else:
                 self.constraints[variable].append(constraint)  # adds the constraint to the variable
-                self.neighbours[variable] |= set(constraint.variables)  # union of sets to remove duplicates
-                self.neighbours[variable].remove(variable)  # cannot be a neighbour to itself
+                if constraint.pairwise:
+                    self.neighbours[variable] |= set(constraint.variables)  # union of sets to remove duplicates
+                    self.neighbours[variable].remove(variable)  # cannot be a neighbour to itself
+                if isinstance(constraint, GlobalConstraint):
+                    self.propagators[variable].append(constraint)
+        if isinstance(constraint, GlobalConstraint):
+            self.global_constraints.append(constraint)
 
-    def _AC3(self, queue: List = None) -> None:
-        """Arc consistency checking algorithm"""
-        if queue is None:
-            queue = [(a, b) for a in self.variables for b in self.neighbours[a]]
+    def components(self) -> List[List[V]]:
+        """Splits the variables into groups that share no constraint, each in variable order. The groups
+        can be solved separately and their solutions merged, largest group first"""
+        groups: DisjointSet[V] = DisjointSet(self.variables)
+        for variable in self.variables:
+            for constraint in self.constraints[variable]:
+                groups.union(variable, constraint.variables[0])
+        components: Dict[V, List[V]] = {}
+        for variable in self.variables:
+            components.setdefault(groups.find(variable), []).append(variable)
+        return sorted(components.values(), key=len, reverse=True)
+
+    def subproblem(self, variables: List[V]) -> "CSP[V, D]":
+        """Returns a CSP of variables with their domains, initial assignment and constraints. variables
+        should be a component, constraints reaching outside of it are left out"""
+        csp: CSP[V, D] = CSP(self.domain_type)
+        csp.set_domains(list(variables), {var: self.domains[var] for var in variables})
+        added: Set[int] = set()
+        for variable in variables:
+            for constraint in self.constraints[variable]:
+                if id(constraint) not in added and all(var in csp.domains for var in constraint.variables):
+                    added.add(id(constraint))
+                    csp.add_constraint(constraint)
+        csp.initial_assignment = {var: val for var, val in self.initial_assignment.items() if var in csp.domains}
+        csp.tables = {(a, c): self.tables[(a, c)] for a in variables for c in csp.neighbours[a]
+                      if (a, c) in self.tables}
+        return csp
+
+    @staticmethod
+    def prefilter(values: Sequence[D], constraints: Sequence[UnaryConstraint[V, D]]) -> Tuple[D, ...]:
+        """Returns the values satisfying every unary constraint as an immutable domain, which the variables of
+        the constraints can share. Unary constraints are only applied here, the search never checks them"""
+        return tuple(value for value in values if all(constraint.satisfied(value) for constraint in constraints))
+
+    def break_symmetries(self, *keys: Callable[[V], Optional[Hashable]]) -> int:
+        """Orders interchangeable variables so only one permutation of their values is searched. Each key
+        maps a variable to its symmetry class, or None to leave it out. Variables of a class are only chained
+        together if they have the same domain and swapping them maps every constraint onto one of the same
+        type, and preassigned variables are never chained. Constraints of the same type are taken to differ
+        only in their variables. Each chain is var1 <= var2 <= ... in variable order. Returns the number of
+        constraints added"""
+        constraints = {var: list(self.constraints[var])
+                       for var in self.variables}  # taken before any chain is added so the keys do not interfere
+        num_added: int = 0
+        for key in keys:
+            classes: Dict[Hashable, List[List[V]]] = {}
+            for var in self.variables:
+                symmetry: Optional[Hashable] = key(var)
+                if symmetry is None or var in self.initial_assignment:
+                    continue
+                groups: List[List[V]] = classes.setdefault((symmetry, tuple(self.domains[var])), [])
+                for group in groups:  # swaps compose, so matching the first variable of a group is enough
+                    if self._interchangeable(group[0], var, constraints[group[0]] + constraints[var]):
+                        group.append(var)
+                        break
+                else:
+                    groups.append([var])
+            for groups in classes.values():
+                for interchangeable in groups:
+                    for var1, var2 in zip(interchangeable, interchangeable[1:]):
+                        self.add_constraint(LessEqualConstraint([var1, var2]))
+                        num_added += 1
+        return num_added
+
+    @staticmethod
+    def _interchangeable(var1: V, var2: V, constraints: List[Constraint[V, D]]) -> bool:
+        """Checks that swapping var1 and var2 maps each of their constraints onto one of the same type over
+        the same positions, the order of the variables only mattering if the constraint is not symmetric"""
+        def signature(constraint: Constraint[V, D], swap: Dict[V, V]) -> tuple:
+            variables = [swap.get(var, var) for var in constraint.variables]
+            return type(constraint), frozenset(variables) if constraint.symmetric else tuple(variables)
+
+        signatures: Set[tuple] = {signature(constraint, {}) for constraint in constraints}
+        return all(signature(constraint, {var1: var2, var2: var1}) in signatures for constraint in constraints)
+
+    def compile_constraints(self) -> None:
+        """Compiles every arc whose constraints are all static into a table of bitset rows.
+        Forward checking and arc consistency then AND rows instead of calling satisfied"""
+        if self.domain_type is not BitsetDomain:
+            raise TypeError("Constraint tables can only be compiled for BitsetDomain domains")
+        self._initialise_current_domains()
+        self.tables = {}
+        for a in self.variables:
+            if not all(constraint.static for constraint in self.constraints[a]):
+                continue
+            for c in self.neighbours[a]:
+                supports = self.current_domains[c]
+                self.tables[(a, c)] = [sum(1 << supports.bit(vc) for vc in supports
+                                           if self._constraints_satisfied(a, va, c, vc, {}))
+                                       for va in self.current_domains[a].values]
+
+    def _AC3(self, arcs: List = None) -> bool:
+        """Arc consistency checking algorithm (AC-3rm), returns False if a domain is wiped out"""
+        if arcs is None:
+            arcs = [(a, b) for a in self.variables for b in self.neighbours[a]]
+        queue = ArcQueue()
+        for arc in arcs:
+            queue.enqueue(arc)
         while queue:
-            a, c = queue.pop(0)
+            a, c = queue.dequeue()
             if self._remove_inconsistent_values(a, c):
+                if not self.current_domains[a]:
+                    return self._wipeout(a, c)
                 for b in self.neighbours[a]:
-                    queue.append((b, a))
+                    queue.enqueue((b, a))
+            elif not self.current_domains[a]:  # wiped out by forward checking before the arc was revised
+                return self._wipeout(a, c)
+        return True
+
+    def _wipeout(self, a: V, c: V) -> bool:
+        """Reports the arc that emptied the domain of a to the variable ordering, always returns False"""
+        if self.ordering is not None:
+            self.ordering.failure(a, c)
+        return False
 
     def _remove_inconsistent_values(self, a, c) -> bool:
         """Returns true if a value is removed, false otherwise"""
+        self.num_revisions += 1
         removed = False
-        for val in self.current_domains[a][:]:
-            result = [self._constraints_satisfied(a, val, c, value, {}) for value in self.current_domains[c]]
-            if not any(result):
-                self.current_domains[a].remove(val)
+        domain = self.current_domains[c]
+        table: Optional[List[int]] = self.tables.get((a, c))
+        if table is not None:  # a value is supported if its row shares a bit with the domain of c
+            bit = self.current_domains[a].bit
+            if self.stats.enabled:
+                self.stats.checks["table"] += len(self.current_domains[a])
+            for val in list(self.current_domains[a]):
+                self.num_checks += 1
+                if not table[bit(val)] & domain.mask:
+                    self._prune(a, val)
+                    removed = True
+            return removed
+        residues = self.residues.setdefault((a, c), {})
+        for val in list(self.current_domains[a]):
+            if val in residues and residues[val] in domain:  # the last support found is still valid
+                continue
+            for value in domain:
+                self.num_checks += 1
+                if self._constraints_satisfied(a, val, c, value, {}):
+                    residues[val] = value
+                    break
+            else:
+                self._prune(a, val)
                 removed = True
         return removed
 
     def _constraints_satisfied(self, var1: V, val1: D, var2: V, val2: D, assignment: Dict[V, D]) -> bool:
         """Checks for these conditions satisfy all constraints on variable 1"""
+        if self.stats.enabled:
+            return self._counted_constraints_satisfied(var1, val1, var2, val2, assignment)
         for constraint in self.constraints[var1]:
             if not constraint.satisfied(var1, val1, var2, val2, assignment):
                 return False
         return True
 
-    def _forward_check(self, var: V, val: D, domains: Dict[V, List[D]],  assignment: Dict[V, D]) -> None:
+    def _counted_constraints_satisfied(self, var1: V, val1: D, var2: V, val2: D, assignment: Dict[V, D]) -> bool:
+        """_constraints_satisfied counting the checks made by each constraint class"""
+        checks = self.stats.checks
+        for constraint in self.constraints[var1]:
+            checks[type(constraint).__name__] += 1
+            if not constraint.satisfied(var1, val1, var2, val2, assignment):
+                return False
+        return True
+
+    def _forward_check(self, var: V, val: D, domains: Dict[V, ListDomain],  assignment: Dict[V, D]) -> None:
         """Checks each constraint and its variables to see if any of their domains can be reduced"""
         for variable in self.neighbours[var]:  # fetches all of the variables the variable relates to
             if variable not in assignment:  # variables already assigned, domains do not need to be reduced
-                for value in domains[variable][:]:
-                    if not self._constraints_satisfied(var, val, variable, value, assignment):
-                        domains[variable].remove(value)  # removes inconsistent values from domains
+                self._reduce_domain(var, val, variable, domains, assignment)
+
+    def _reduce_domain(self, var: V, val: D, variable: V, domains: Dict[V, ListDomain],
+                       assignment: Dict[V, D]) -> bool:
+        """Removes the values of variable inconsistent with var=val, returns True if any were removed"""
+        size: int = len(domains[variable])
+        table: Optional[List[int]] = self.tables.get((var, variable))
+        if table is not None:  # keeps only the values supported by val in a single AND
+            if self.stats.enabled:
+                self.stats.checks["table"] += 1
+            self._restrict(variable, table[domains[var].bit(val)])
+        else:
+            for value in list(domains[variable]):
+                if not self._constraints_satisfied(var, val, variable, value, assignment):
+                    self._prune(variable, value)  # removes inconsistent values from domains
+        return len(domains[variable]) != size
 
     def _check_complete(self, assignment: Dict[V, D]) -> bool:
         """Checks if the program is complete by checking if all the variables have values"""
@@ -197,13 +761,12 @@ class CSP(Generic[V, D]):
 
     def _select_unassigned_variable(self, assignment: Dict[V, D]) -> V:
         """Considers which variable to try next"""
+        if self.ordering is not None:  # most constrained variable heuristics kept up to date in a heap
+            return self.ordering.select(assignment)
         # selects variables that are in the CSP but are not in the assignment
         unassigned = [v for v in self.variables if v not in assignment]
-        if self.mcv:  # most constrained value heuristic
-            weighted_vars = [(v, self._num_legal_values(v)) for v in unassigned]  # assigns a weight to each variable
-            weighted_vars.sort(key=lambda k: k[1])  # sorts the variables by domain length
-            return weighted_vars[0][0]
-        return choice(unassigned)  # if mcv not specified then a random variable is returned
+        # if no ordering is specified then a random variable is returned
+        return self.rng.choice(unassigned) if self.rng is not None else choice(unassigned)
 
     def _num_legal_values(self, var: V) -> int:
         """Returns the number of items in a domain"""
@@ -211,25 +774,339 @@ class CSP(Generic[V, D]):
             return len(self.current_domains[var])
         return len(self.domains[var])
 
+    def _degree(self, var: V) -> int:
+        """Returns the number of variables var shares a constraint with"""
+        return len(self.neighbours[var])
+
     def _order_domain_values(self, variable: V, assignment: Dict[V, D]) -> D:
         """Decides whether reduced variable domain should be used"""
         if self.current_domains:
-            domain = self.current_domains[variable]
+            domain = list(self.current_domains[variable])  # copied as propagation edits the live domain
             if not domain:
                 self._unassign(variable, assignment)
         else:
-            domain = self.domains[variable][:]
+            domain = list(self.domains[variable])
+        if variable in self.preferred and self.preferred[variable] in domain:
+            domain.remove(self.preferred[variable])
+            domain.insert(0, self.preferred[variable])
         return domain
 
-    def backtracking_search(self, mcv=False, fc=False):
-        """Call point to begin the backtracking search"""
+    def backtracking_search(self, mcv=False, fc=False, iterative=True, max_nodes=None, ordering=None,
+                            cbj=False, nogoods=None):
+        """Call point to begin the backtracking search. The iterative search can be paused after
+        max_nodes assignments and continued with resume_search. ordering is "mrv", "dom/deg" or "dom/wdeg",
+        or the ordering of an earlier search to keep what it learnt, mcv on its own uses mrv. cbj jumps back
+        to the cause of a dead end and records it in nogoods, a NogoodStore which can be shared between
+        searches of the same model"""
+        if self.stats.enabled:
+            self.stats.reset()
         self.num_backtracks = 0
-        if fc:
-            for variable in self.variables:
-                self.current_domains[variable] = self.domains[variable][:]
-            self._AC3()
+        self.num_revisions, self.num_checks = 0, 0
+        self.trail, self.trail_marks = [], Stack()
+        self.residues = {}
+        self.choice_points, self.search_assignment = Stack(), dict(self.initial_assignment)
+        self.paused, self.finished = False, False
+        self.cbj, self.nogoods = cbj, nogoods if cbj else None
+        self.conflict_sets, self.pruned_by, self.reductions = {}, {}, {}
+        if ordering is None and mcv:
+            ordering = "mrv"
+        self.ordering = None
+        if isinstance(ordering, VariableOrdering):
+            ordering.reset(self.variables)
+            self.ordering = ordering
+        elif ordering is not None:
+            self.ordering = create_ordering(ordering, self.variables, self._num_legal_values, self._degree,
+                                            self.neighbours.__getitem__)
+        if fc or self.global_constraints:  # global constraints are propagated once even without fc
+            self._initialise_current_domains()
+            start: float = timer()
+            consistent: bool = ((not fc or (self._propagate_initial_assignment() and self._AC3()))
+                                and self._propagate_global_constraints(self.initial_assignment))
+            self.stats.propagation_time += timer() - start
+            if not consistent:
+                return self._finish(None)
         self.fc, self.mcv = fc, mcv
-        return self._recursive_backtracking(self.initial_assignment)
+        if not iterative and not cbj:
+            return self._finish(self._recursive_backtracking(self.initial_assignment))
+        return self.resume_search(max_nodes)
+
+    def _propagate_initial_assignment(self) -> bool:
+        """Reduces the current domain of each preassigned variable to its value and forward checks it,
+        returns False if a preassigned value is not in its domain or wipes out another domain"""
+        for var, val in self.initial_assignment.items():
+            for value in list(self.current_domains[var]):
+                if value != val:
+                    self._prune(var, value)
+            if val not in self.current_domains[var]:
+                return False
+        for var, val in self.initial_assignment.items():
+            self._forward_check(var, val, self.current_domains, self.initial_assignment)
+            if any(not self.current_domains[variable] for variable in self.neighbours[var]):
+                return False
+        return True
+
+    def repair(self, previous: Dict[V, D], **search_kwargs) -> Optional[Dict[V, D]]:
+        """Re-solves after the model has changed, keeping as much of previous, an earlier solution, as
+        possible. Values no longer in their domain are dropped, as is the later value of each pair that
+        breaks a constraint, and the rest are kept as the initial assignment. If the freed variables cannot
+        be solved around the kept ones, their neighbours are freed too, widening until a solution is found
+        or the freed variables share no constraint with the kept ones. Freed variables try their previous
+        value first. search_kwargs are passed to backtracking_search, with max_nodes an attempt that runs
+        out of nodes also widens. Returns the solution, or None if there is none"""
+        kept: Dict[V, D] = {}
+        for var in self.variables:
+            if var in previous and previous[var] in self.domains[var] and \
+                    not self._num_conflicts(var, previous[var], kept):
+                kept[var] = previous[var]
+        free: Set[V] = {var for var in self.variables if var not in kept}
+        initial_assignment: Dict[V, D] = self.initial_assignment
+        self.preferred = {var: val for var, val in previous.items() if var in self.domains}
+        try:
+            while True:
+                self.initial_assignment = {var: val for var, val in kept.items() if var not in free}
+                solution: Optional[Dict[V, D]] = self.backtracking_search(**search_kwargs)
+                if solution is not None:
+                    return solution
+                widened: Set[V] = free.union(*(self.neighbours[var] for var in free))
+                if len(widened) == len(free):
+                    if not self.paused:  # the freed variables have no solution whatever the kept ones are
+                        return None
+                    search_kwargs = dict(search_kwargs, max_nodes=None)
+                free = widened
+        finally:
+            self.initial_assignment = initial_assignment
+            self.preferred = {}
+
+    def _finish(self, solution: Optional[Dict[V, D]]) -> Optional[Dict[V, D]]:
+        """Marks the search as finished and reports it to the statistics, returns solution"""
+        self.finished = True
+        if self.stats.enabled:
+            self.stats.solution(self)
+        return solution
+
+    def resume_search(self, max_nodes: int = None) -> Optional[Dict[V, D]]:
+        """Continues the iterative search from its choice points. Returns None with paused set if
+        max_nodes assignments are made before a solution is found or the search space is exhausted"""
+        assignment: Dict[V, D] = self.search_assignment
+        if self.finished:
+            return assignment if self._check_complete(assignment) else None
+        self.paused = False
+        nodes: int = 0
+        while True:
+            if self._check_complete(assignment):  # Checks if program is complete
+                return self._finish(assignment)
+            var: V = self._select_unassigned_variable(assignment)
+            self.choice_points.push(ChoicePoint(var, self._order_domain_values(var, assignment)))
+            if self.cbj:
+                self.conflict_sets[var] = set()
+            while not self._next_value(self.choice_points.top(), assignment):
+                if not self._backjump(assignment):  # every value failed so falls back to an earlier variable
+                    return self._finish(None)
+            nodes += 1
+            if max_nodes is not None and nodes >= max_nodes:
+                self.paused = True
+                return None
+
+    def _next_value(self, point: ChoicePoint, assignment: Dict[V, D]) -> bool:
+        """Undoes the value of the choice point and assigns the next consistent one, False if none is left"""
+        if self.cbj:
+            return self._cbj_next_value(point, assignment)
+        if point.assigned:
+            self._backtrack_domains()
+            self._unassign(point.variable, assignment)
+            point.assigned = False
+        while point.position < len(point.values):
+            val: D = point.values[point.position]
+            point.position += 1
+            if self._num_conflicts(point.variable, val, assignment) == 0:
+                if self._assign(point.variable, val, assignment):
+                    point.assigned = True
+                    return True
+                self._backtrack_domains()
+            self._unassign(point.variable, assignment)
+        return False
+
+    def _backjump(self, assignment: Dict[V, D]) -> bool:
+        """Pops the exhausted choice point and unwinds to the variable to try next, False if there is none.
+        With cbj this is the deepest variable in the conflict set, which inherits the rest of the set"""
+        point: ChoicePoint = self.choice_points.pop_item()
+        if not self.cbj:
+            return not self.choice_points.empty()
+        conflicts: Set[V] = self.conflict_sets.pop(point.variable) | set(self.pruned_by.get(point.variable, ()))
+        conflicts.discard(point.variable)
+        if self.nogoods is not None and conflicts:  # these assignments leave the variable without a value
+            self.nogoods.add({var: assignment[var] for var in conflicts})
+        while not self.choice_points.empty() and self.choice_points.top().variable not in conflicts:
+            jumped: ChoicePoint = self.choice_points.pop_item()  # played no part in the dead end
+            if jumped.assigned:
+                self._cbj_undo(jumped, assignment)
+            del self.conflict_sets[jumped.variable]
+        if self.choice_points.empty():
+            return False
+        culprit: V = self.choice_points.top().variable
+        self.conflict_sets[culprit] |= conflicts - {culprit}
+        return True
+
+    def _cbj_next_value(self, point: ChoicePoint, assignment: Dict[V, D]) -> bool:
+        """Like _next_value, but records the assigned variables responsible for every rejected value.
+        Only forward checking is used so that every pruning can be traced to one assignment"""
+        var: V = point.variable
+        if point.assigned:
+            self._cbj_undo(point, assignment)
+        while point.position < len(point.values):
+            val: D = point.values[point.position]
+            point.position += 1
+            conflicts: List[V] = self._conflicting_variables(var, val, assignment)
+            if not conflicts and self.nogoods is not None:
+                nogood: Optional[frozenset] = self.nogoods.violated(var, val, assignment)
+                if nogood is not None:
+                    conflicts = [variable for variable, value in nogood if variable != var]
+            if conflicts:
+                self.conflict_sets[var].update(conflicts)
+                continue
+            self.num_assigns += 1
+            assignment[var] = val
+            point.assigned = True
+            if self.stats.enabled:
+                self.stats.node(len(assignment), self)
+            if not self.fc:
+                return True
+            self.trail_marks.push(len(self.trail))
+            start: float = timer() if self.stats.enabled else 0.0
+            wiped: Optional[V] = self._cbj_forward_check(var, val, assignment)
+            if self.stats.enabled:
+                self.stats.propagation_time += timer() - start
+            if wiped is None:
+                return True
+            self.conflict_sets[var].update(self.pruned_by[wiped])
+            self.conflict_sets[var].discard(var)
+            self._cbj_undo(point, assignment)
+        return False
+
+    def _cbj_forward_check(self, var: V, val: D, assignment: Dict[V, D]) -> Optional[V]:
+        """Forward checks var=val noting which variables it pruned, returns the first variable wiped out"""
+        reduced: List[V] = []
+        self.reductions[var] = reduced
+        for variable in self.neighbours[var]:
+            if variable not in assignment and self._reduce_domain(var, val, variable, self.current_domains, assignment):
+                reduced.append(variable)
+                self.pruned_by.setdefault(variable, []).append(var)
+                if not self.current_domains[variable]:
+                    self._wipeout(variable, var)
+                    return variable
+        return None
+
+    def _cbj_undo(self, point: ChoicePoint, assignment: Dict[V, D]) -> None:
+        """Undoes the assignment of the choice point and the forward checking it caused"""
+        self._backtrack_domains()
+        for variable in self.reductions.pop(point.variable, ()):
+            self.pruned_by[variable].pop()  # prunings are undone last in first out
+        self._unassign(point.variable, assignment)
+        point.assigned = False
+
+    def _conflicting_variables(self, var: V, val: D, assignment: Dict[V, D]) -> List[V]:
+        """Returns the assigned variables that conflict with var=val"""
+        conflicts: List[V] = []
+        for variable in self.neighbours[var]:
+            value: Optional[D] = assignment.get(variable, None)
+            if value is not None and not self._constraints_satisfied(var, val, variable, value, assignment):
+                conflicts.append(variable)
+        for constraint in self.propagators[var]:
+            if not constraint.pairwise:
+                conflicts.extend(constraint.conflicts(var, val, assignment))
+        return conflicts
+
+    def local_search(self, max_steps: int = 100000, seed: int = None, tabu_tenure: int = 10,
+                     walk_probability: float = 0.02) -> Optional[Dict[V, D]]:
+        """Min-conflicts hill climbing over the same variables, domains and constraints as backtracking_search.
+        Starts from a greedy assignment, then repeatedly moves a random conflicted variable to the value with
+        the fewest conflicts. A value just left is tabu for tabu_tenure steps unless it removes every conflict,
+        and with walk_probability a random value is taken instead. Returns None if max_steps runs out"""
+        rng = Random(seed)
+        if self.stats.enabled:
+            self.stats.reset()
+        assignment: Dict[V, D] = dict(self.initial_assignment)
+        free: List[V] = [var for var in self.variables if var not in self.initial_assignment]
+        for var in free:  # greedy start, each variable takes its least conflicting value so far
+            assignment[var] = self._min_conflicts_value(var, assignment, rng)[0]
+        conflicts: Dict[V, int] = {var: self._num_conflicts(var, assignment[var], assignment) for var in free}
+        conflicted: RandomSet[V] = RandomSet()
+        for var in free:
+            if conflicts[var]:
+                conflicted.add(var)
+        tabu: Dict[Tuple[V, D], int] = {}  # step until which a variable cannot take a value again
+        for step in range(max_steps):
+            if not conflicted:
+                break
+            var: V = conflicted.choice(rng)
+            if rng.random() < walk_probability:
+                val: D = rng.choice(self.domains[var])
+                num_conflicts: int = self._num_conflicts(var, val, assignment)
+            else:
+                val, num_conflicts = self._min_conflicts_value(var, assignment, rng, tabu, step)
+            old: D = assignment[var]
+            if val == old:
+                continue
+            self.num_assigns += 1
+            if self.stats.enabled:
+                self.stats.node(len(assignment), self)
+            tabu[(var, old)] = step + tabu_tenure
+            # only the neighbours of var can change their count, checked against the assignment before the move
+            before: Dict[V, bool] = {
+                variable: not self._constraints_satisfied(variable, assignment[variable], var, old, assignment)
+                for variable in self.neighbours[var] if variable in conflicts}
+            assignment[var] = val
+            conflicts[var] = num_conflicts
+            if not num_conflicts:
+                conflicted.discard(var)
+            for variable, was_conflicting in before.items():
+                after = not self._constraints_satisfied(variable, assignment[variable], var, val, assignment)
+                if was_conflicting != after:
+                    conflicts[variable] += after - was_conflicting
+                    if conflicts[variable]:
+                        conflicted.add(variable)
+                    else:
+                        conflicted.discard(variable)
+            # the variables of a constraint that is not pairwise are no neighbours of var, so they are recounted
+            for constraint in self.propagators[var]:
+                if constraint.pairwise:
+                    continue
+                for variable in constraint.variables:
+                    if variable != var and variable in conflicts:
+                        conflicts[variable] = self._num_conflicts(variable, assignment[variable], assignment)
+                        if conflicts[variable]:
+                            conflicted.add(variable)
+                        else:
+                            conflicted.discard(variable)
+        if self.stats.enabled:
+            self.stats.solution(self)
+        return assignment if not conflicted else None
+
+    def _min_conflicts_value(self, var: V, assignment: Dict[V, D], rng: Random, tabu: Dict[Tuple[V, D], int] = None,
+                             step: int = 0) -> Tuple[D, int]:
+        """Returns a value of var with the fewest conflicts and its count, ties are broken at random"""
+        best: List[D] = []
+        least: Optional[int] = None
+        for val in self.domains[var]:
+            num_conflicts: int = self._num_conflicts(var, val, assignment)
+            if tabu and tabu.get((var, val), -1) > step and num_conflicts:  # aspiration overrides tabu
+                continue
+            if least is None or num_conflicts < least:
+                best, least = [val], num_conflicts
+            elif num_conflicts == least:
+                best.append(val)
+        if not best:  # every value is tabu
+            return assignment[var], self._num_conflicts(var, assignment[var], assignment)
+        return rng.choice(best), least
+
+    def _initialise_current_domains(self) -> None:
+        """Copies each domain into the selected domain type, variables sharing a domain list share its values"""
+        templates = {}  # keyed by id so one BitsetDomain index is built per distinct domain list
+        for variable in self.variables:
+            values = self.domains[variable]
+            if id(values) not in templates:
+                templates[id(values)] = self.domain_type(values)
+            self.current_domains[variable] = templates[id(values)].copy()
 
     def _recursive_backtracking(self, assignment: Dict[V, D]) -> Optional[Dict[V, D]]:
         """Depth-first search which backtracks to the last known decision and chooses a different path"""
@@ -239,10 +1116,10 @@ class CSP(Generic[V, D]):
         var: V = self._select_unassigned_variable(assignment)
         for val in self._order_domain_values(var, assignment):
             if self._num_conflicts(var, val, assignment) == 0:  # if still consistent then recurse again
-                self._assign(var, val, assignment)
-                result: Optional[Dict[V, D]] = self._recursive_backtracking(assignment)
-                if result is not None:  # if the result is not found, the program will backtrack
-                    return result
+                if self._assign(var, val, assignment):  # skips the subtree if propagation found a dead end
+                    result: Optional[Dict[V, D]] = self._recursive_backtracking(assignment)
+                    if result is not None:  # if the result is not found, the program will backtrack
+                        return result
                 self._backtrack_domains()
             self._unassign(var, assignment)
         return None
@@ -158,22 +158,33 @@ class MainDatabase:
         filepath = filepath.replace("%20", " ")
         return filepath
 
-    def connect_database(self, filepath):
-        """Creates the connection object to the database"""
+    def local_filepath(self):
+        """Returns the path of the open database file on this computer"""
+        if self.filepath.startswith("file://localhost/"):
+            return self.os_filepath(self.filepath)
+        if self.filepath.startswith("file:"):
+            return self.filepath[5:]
+        return self.filepath
+
+    def connect_database(self, filepath, show_errors=True):
+        """Creates the connection object to the database, errors are only shown in a message box if
+        show_errors, as a background process has no window"""
         query = "?mode=rw"
         # exception is to ensure the path is valid
         try:
             connection = sql.connect(filepath+query, uri=True)
             cursor = connection.cursor()
         except sql.DatabaseError:
-            messagebox.showerror("Error", "Invalid filepath\n(%s)" % filepath)
+            if show_errors:
+                messagebox.showerror("Error", "Invalid filepath\n(%s)" % filepath)
             return False
         # connection object will connect to files that are not databases
         try:
             # makes sure the database file contains a students table
             cursor.execute("SELECT * FROM students")
         except sql.DatabaseError:
-            messagebox.showerror("Error", "Unable to open files of this type\n(%s)" % filepath)
+            if show_errors:
+                messagebox.showerror("Error", "Unable to open files of this type\n(%s)" % filepath)
             connection.close()
             return False
         # upon connection, objects are assigned as attributes
@@ -1032,6 +1043,51 @@ class MainDatabase:
                             {"year_id": year_id})
         return self.cursor.fetchall()
 
+    def get_curriculum_snapshot(self):
+        """Fetches everything the curriculum CSP is built from in one read transaction, so every part is
+        from the same state of the database. The placement counts only include periods with classes, and only
+        classes outside the sets, as the classes of the sets are the ones the CSP places"""
+        snapshot = {}
+        began = not self.connection.in_transaction
+        if began:
+            self.cursor.execute("BEGIN")
+        try:
+            self.cursor.execute("""SELECT * FROM years""")
+            snapshot["years"] = self.cursor.fetchall()
+            self.cursor.execute("""SELECT MaxNoStudents FROM classrooms""")
+            snapshot["classroom_sizes"] = self.tuples_to_list(self.cursor.fetchall())
+            self.cursor.execute("""SELECT Student_Year, count(Student_ID) FROM students GROUP BY Student_Year""")
+            snapshot["num_students"] = self.cursor.fetchall()
+            self.cursor.execute("""SELECT Period_ID FROM periods ORDER BY Period_ID""")
+            snapshot["periods"] = self.tuples_to_list(self.cursor.fetchall())
+            self.cursor.execute("""SELECT Year_ID, teacher_subjects.Subject_ID, Subject_Option,
+                                    count(Teacher_ID) AS Num_Teachers
+                                    FROM teacher_subjects
+                                    INNER JOIN year_subjects
+                                    ON teacher_subjects.Subject_ID = year_subjects.Subject_ID
+                                    WHERE Subject_Periods != 0
+                                    GROUP BY Year_ID, teacher_subjects.Subject_ID
+                                    ORDER BY Year_ID, Num_Teachers DESC""")
+            snapshot["subject_teachers"] = self.cursor.fetchall()
+            self.cursor.execute("""SELECT Class_Year, Period_ID, count(class_placement.Class_ID)
+                                    FROM class_placement
+                                    INNER JOIN classes
+                                    ON class_placement.Class_ID = classes.Class_ID
+                                    WHERE class_placement.Class_ID NOT IN (SELECT Class_ID FROM set_classes)
+                                    GROUP BY Class_Year, Period_ID""")
+            snapshot["year_period_classes"] = self.cursor.fetchall()
+            self.cursor.execute("""SELECT Class_Subject, Period_ID, count(class_placement.Class_ID)
+                                    FROM class_placement
+                                    INNER JOIN classes
+                                    ON class_placement.Class_ID = classes.Class_ID
+                                    WHERE class_placement.Class_ID NOT IN (SELECT Class_ID FROM set_classes)
+                                    GROUP BY Class_Subject, Period_ID""")
+            snapshot["subject_period_classes"] = self.cursor.fetchall()
+        finally:
+            if began:
+                self.connection.commit()
+        return snapshot
+
     def get_existing_set_classes(self, subject_id, year_id):
         self.cursor.execute("""SELECT count(Class_ID) as Num_Classes
                                 FROM sets
@@ -1080,6 +1136,36 @@ class MainDatabase:
                                  "teacher": teacher_id,
                                  "classroom": classroom_id})
 
+    def move_class_placements(self, removed, added):
+        """Deletes the placements in removed, rows of (period, class), and inserts the placements in added,
+        rows of (period, class, teacher, classroom), in a single transaction. The other placements of the
+        classes keep their teachers and classrooms"""
+        with self.connection:
+            self.cursor.executemany("""DELETE FROM class_placement
+                                        WHERE Period_ID = (:period) AND Class_ID = (:class)""",
+                                    [{"period": period, "class": class_id} for period, class_id in removed])
+            self.cursor.executemany("""INSERT INTO class_placement
+                                        VALUES (:period, :class, :teacher, :classroom)""",
+                                    [{"period": period, "class": class_id, "teacher": teacher_id,
+                                      "classroom": classroom_id}
+                                     for period, class_id, teacher_id, classroom_id in added])
+
+    def get_class_placements(self):
+        """Fetches the period of every placed class, in period order within each class"""
+        self.cursor.execute("""SELECT Class_ID, Period_ID
+                                FROM class_placement
+                                ORDER BY Class_ID, Period_ID""")
+        return self.cursor.fetchall()
+
+    def get_set_classes(self):
+        """Fetches the classes of every set, in class order within each set"""
+        self.cursor.execute("""SELECT Set_Year, Subject_ID, Set_Number, set_classes.Class_ID
+                                FROM sets
+                                INNER JOIN set_classes
+                                ON sets.Set_ID = set_classes.Set_ID
+                                ORDER BY Set_Year, Subject_ID, Set_Number, set_classes.Class_ID""")
+        return self.cursor.fetchall()
+
     def create_empty_class(self, name, number, year, subject, cls_type):
         with self.connection:
             self.cursor.execute("""INSERT INTO classes (Class_Name,
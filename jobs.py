@@ -0,0 +1,141 @@
+from typing import Callable, List, Optional
+from timeit import default_timer as timer
+import multiprocessing as mp
+import queue
+import algorithm
+from database import MainDatabase
+from timetabling import CurriculumCSP
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once it has been asked to stop"""
+
+
+class JobProgress:
+    """Handed to a job in its process, sends events back to the GUI and checks for cancellation.
+    Events are (kind, data) tuples, kind is "phase", "progress", "done", "error" or "cancelled" """
+
+    def __init__(self, events: mp.Queue, cancel: mp.Event) -> None:
+        self.events = events
+        self.cancel = cancel
+
+    def phase(self, name: str) -> None:
+        """Starts a named step of the job"""
+        self.check()
+        self.events.put(("phase", name))
+
+    def progress(self, done: int, total: int, nodes: int = 0) -> None:
+        """Reports done out of total, such as lessons placed, and the search nodes so far"""
+        self.check()
+        self.events.put(("progress", {"done": done, "total": total, "nodes": nodes}))
+
+    def check(self) -> None:
+        """Stops the job if it has been cancelled"""
+        if self.cancel.is_set():
+            raise JobCancelled()
+
+
+def create_classes(database: MainDatabase, progress: JobProgress) -> bool:
+    """Creates the blocks, sets and classes of every year. Each year is saved as it is created, so a
+    cancelled job keeps the years already finished"""
+    progress.phase("Creating classes")
+    algorithm.Classes(database).create_classes(on_year=progress.progress)
+    return True
+
+
+def create_timetable(database: MainDatabase, progress: JobProgress, processes: int = None) -> bool:
+    """Solves the curriculum CSP and saves the placements, returns False if there is no solution.
+    The database is only written once the whole timetable is solved"""
+    csp: CurriculumCSP = CurriculumCSP(database)
+    progress.phase("Reading the database")
+    csp.config_data()
+    progress.phase("Placing lessons")
+    solution = csp.config_csp(processes, lambda placed, nodes: progress.progress(placed, len(csp.variables), nodes))
+    if solution is None:
+        return False
+    progress.phase("Saving the timetable")
+    csp.save_solution(solution)
+    return True
+
+
+def _run_job(job: Callable, filepath: str, args: tuple, events: mp.Queue, cancel: mp.Event) -> None:
+    """Entry point of the job process, which opens its own connection as sqlite connections cannot be shared
+    between processes"""
+    database: MainDatabase = MainDatabase()
+    if not database.connect_database(filepath, show_errors=False):
+        events.put(("error", "Unable to open the database"))
+        return
+    try:
+        result = job(database, JobProgress(events, cancel), *args)
+    except JobCancelled:
+        events.put(("cancelled", None))
+    except Exception as error:
+        events.put(("error", "%s: %s" % (type(error).__name__, error)))
+    else:
+        events.put(("done", result))
+    finally:
+        database.close_database()
+
+
+class JobRunner:
+    """Runs one job at a time in a separate process. The GUI polls for its events, so it never blocks
+    while the job runs. A cancelled job stops at its next check, or is terminated after grace seconds"""
+    FINAL_EVENTS = ("done", "error", "cancelled")
+
+    def __init__(self, grace: float = 5.0) -> None:
+        self.grace: float = grace
+        self.process: Optional[mp.Process] = None
+        self.events: Optional[mp.Queue] = None
+        self.cancel_event: Optional[mp.Event] = None
+        self.cancelled_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None
+
+    def start(self, job: Callable, filepath: str, *args) -> None:
+        """Starts job(database, progress, *args) on its own connection to the database at filepath"""
+        if self.running:
+            raise RuntimeError("A job is already running")
+        self.events, self.cancel_event, self.cancelled_at = mp.Queue(), mp.Event(), None
+        # not a daemon, as the solver starts processes of its own
+        self.process = mp.Process(target=_run_job, args=(job, filepath, args, self.events, self.cancel_event))
+        self.process.start()
+
+    def cancel(self) -> None:
+        """Asks the job to stop"""
+        if self.running and self.cancelled_at is None:
+            self.cancel_event.set()
+            self.cancelled_at = timer()
+
+    def poll(self) -> List[tuple]:
+        """Returns the events sent since the last poll without waiting. The last event of a job is "done",
+        "error" or "cancelled", after which the runner can start another job"""
+        if not self.running:
+            return []
+        alive: bool = self.process.is_alive()  # checked first so no event sent before exiting is missed
+        events: List[tuple] = []
+        try:
+            while True:
+                events.append(self.events.get_nowait())
+        except queue.Empty:
+            pass
+        if any(kind in self.FINAL_EVENTS for kind, _ in events):
+            self._join()
+        elif self.cancelled_at is not None and timer() - self.cancelled_at > self.grace:
+            self.process.terminate()
+            self._join()
+            events.append(("cancelled", None))
+        elif not alive:
+            self._join()
+            events.append(("error", "The job stopped unexpectedly"))
+        return events
+
+    def _join(self) -> None:
+        self.process.join()
+        self.events.close()
+        self.process, self.events, self.cancel_event = None, None, None
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,149 @@
+from typing import TypeVar, Collection, Container, Dict, List, Mapping, Tuple
+from collections import deque
+
+L = TypeVar("L")
+R = TypeVar("R")
+
+
+def hopcroft_karp(adjacency: Mapping[L, Collection[R]], matching: Mapping[L, R] = None) -> Dict[L, R]:
+    """Maximum matching of the left vertices (keys of adjacency) to the right vertices they are adjacent to.
+    A previous matching can be passed as the starting point, its edges no longer in adjacency are dropped"""
+    match_left: Dict[L, R] = {}
+    match_right: Dict[R, L] = {}
+    for u, v in (matching or {}).items():
+        if u in adjacency and v not in match_right and v in adjacency[u]:
+            match_left[u], match_right[v] = v, u
+    while True:
+        dist: Dict[L, object] = {}  # layer of each left vertex in the alternating forest, None once a dead end
+        queue = deque()
+        for u in adjacency:
+            if u not in match_left:
+                dist[u] = 0
+                queue.append(u)
+        found: bool = False
+        while queue:  # layers the graph from the free left vertices to the nearest free right vertices
+            u = queue.popleft()
+            for v in adjacency[u]:
+                w = match_right.get(v)
+                if w is None:
+                    found = True
+                elif w not in dist:
+                    dist[w] = dist[u] + 1
+                    queue.append(w)
+        if not found:
+            return match_left
+
+        def augment(u: L) -> bool:
+            """Follows the layers from u to a free right vertex and flips the matching along the path"""
+            for v in adjacency[u]:
+                w = match_right.get(v)
+                if w is None or (dist.get(w) == dist[u] + 1 and augment(w)):
+                    match_left[u], match_right[v] = v, u
+                    return True
+            dist[u] = None
+            return False
+
+        for u in [u for u in adjacency if u not in match_left]:
+            augment(u)
+
+
+def inconsistent_edges(adjacency: Mapping[L, Collection[R]], matching: Mapping[L, R]) -> List[Tuple[L, R]]:
+    """Returns the edges that belong to no matching covering every left vertex (Regin's all different
+    filtering). matching must cover every left vertex. An unmatched edge can be swapped into a matching
+    if it lies on an alternating cycle, so both ends share a strongly connected component of the graph
+    directed left to right along matched edges and right to left along the others, or if it lies on
+    an alternating path from a right vertex nobody is matched to"""
+    left: List[L] = list(adjacency)
+    right: Dict[R, int] = {}  # right vertices are numbered after the left ones
+    for u in left:
+        for v in adjacency[u]:
+            if v not in right:
+                right[v] = len(left) + len(right)
+    graph: List[List[int]] = [[] for _ in range(len(left) + len(right))]
+    for i, u in enumerate(left):
+        for v in adjacency[u]:
+            if matching[u] == v:
+                graph[i].append(right[v])
+            else:
+                graph[right[v]].append(i)
+    matched: Container[R] = set(matching.values())
+    reachable: List[bool] = [False] * len(graph)
+    stack: List[int] = [node for v, node in right.items() if v not in matched]
+    for node in stack:
+        reachable[node] = True
+    while stack:
+        for successor in graph[stack.pop()]:
+            if not reachable[successor]:
+                reachable[successor] = True
+                stack.append(successor)
+    component: List[int] = _strongly_connected_components(graph)
+    edges: List[Tuple[L, R]] = []
+    for i, u in enumerate(left):
+        for v in adjacency[u]:
+            node: int = right[v]
+            if matching[u] != v and not reachable[node] and component[node] != component[i]:
+                edges.append((u, v))
+    return edges
+
+
+def hall_violator(adjacency: Mapping[L, Collection[R]], matching: Mapping[L, R]) -> List[L]:
+    """Returns left vertices with fewer neighbours than their number, proving no matching covers them all.
+    matching must be maximum and leave a left vertex unmatched, the set is every left vertex reachable from
+    it along alternating paths"""
+    match_right: Dict[R, L] = {v: u for u, v in matching.items()}
+    start: L = next(u for u in adjacency if u not in matching)
+    reached: List[L] = [start]
+    seen: set = {start}
+    for u in reached:  # grows while it is iterated, a breadth first search
+        for v in adjacency[u]:
+            w = match_right[v]  # every right vertex reached is matched, otherwise the matching was not maximum
+            if w not in seen:
+                seen.add(w)
+                reached.append(w)
+    return reached
+
+
+def _strongly_connected_components(graph: List[List[int]]) -> List[int]:
+    """Iterative Tarjan, returns the component number of every node"""
+    index: List[int] = [-1] * len(graph)
+    low: List[int] = [0] * len(graph)
+    component: List[int] = [-1] * len(graph)
+    on_stack: List[bool] = [False] * len(graph)
+    stack: List[int] = []
+    counter, num_components = 0, 0
+    for root in range(len(graph)):
+        if index[root] != -1:
+            continue
+        work: List[Tuple[int, int]] = [(root, 0)]  # node and the position of the next successor to visit
+        while work:
+            node, position = work.pop()
+            if position == 0:
+                index[node] = low[node] = counter
+                counter += 1
+                stack.append(node)
+                on_stack[node] = True
+            elif position <= len(graph[node]):  # returning from the successor before position
+                low[node] = min(low[node], low[graph[node][position - 1]])
+            while position < len(graph[node]):
+                successor: int = graph[node][position]
+                position += 1
+                if index[successor] == -1:
+                    work.append((node, position))
+                    work.append((successor, 0))
+                    break
+                if on_stack[successor]:
+                    low[node] = min(low[node], index[successor])
+            else:
+                if low[node] == index[node]:
+                    while True:
+                        member: int = stack.pop()
+                        on_stack[member] = False
+                        component[member] = num_components
+                        if member == node:
+                            break
+                    num_components += 1
+    return component
+
+
+if __name__ == '__main__':
+    pass
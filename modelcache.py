@@ -0,0 +1,162 @@
+from typing import Callable, Dict, List, Sequence
+from array import array
+import hashlib
+import glob
+import mmap
+import os
+
+
+MAGIC = 0x43535043  # "CSPC"
+VERSION = 2
+HEADER = 7  # magic, version, variables, fields per variable, domains, constraints, tables
+
+
+def model_key(*inputs) -> str:
+    """Returns a digest of the data a model is built from, equal data gives an equal key"""
+    return hashlib.sha1(repr(inputs).encode()).hexdigest()[:16]
+
+
+class ModelCache:
+    """Compiled constraintframework CSPs saved next to the database they are built from. A file holds the
+    variables as fields, the distinct domains of ints, the constraints as indices of their variables followed
+    by their int parameters and the compiled tables, all as 32 bit words, and is memory-mapped to be read
+    back. Files are named after the database, the key of the data and a variant for the models built
+    differently from the same data.
+    Saving a model evicts the files of every other key, as their data has since changed"""
+
+    def __init__(self, db_path: str, fields: Callable, variable_type: Callable,
+                 constraint_types: Sequence[type]) -> None:
+        self.db_path: str = db_path
+        self.fields: Callable = fields  # maps a variable to a tuple of ints
+        self.variable_type: Callable = variable_type  # rebuilds a variable from its fields
+        # constructed from a list of variables, or with from_parameters if they have int parameters
+        self.constraint_types: List[type] = list(constraint_types)
+
+    def path(self, key: str, variant: str) -> str:
+        return "%s.%s.%s.csp" % (self.db_path, key, variant)
+
+    def load(self, csp, key: str, variant: str) -> bool:
+        """Sets the variables, domains, constraints and tables of csp from the cache file.
+        Returns False if there is none, an unreadable file is removed"""
+        path: str = self.path(key, variant)
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as view, view.cast("i") as words:
+                    model: tuple = self._decode(view, words)
+        except (OSError, ValueError, IndexError, TypeError):
+            self._remove(path)
+            return False
+        variables, domains, constraints, tables = model
+        csp.set_domains(variables, domains)
+        for constraint in constraints:
+            csp.add_constraint(constraint)
+        csp._initialise_current_domains()
+        csp.tables = tables
+        return True
+
+    def save(self, csp, key: str, variant: str) -> None:
+        """Writes the model of csp to its cache file and evicts the files of other keys"""
+        path: str = self.path(key, variant)
+        try:
+            data: bytes = self._encode(csp)
+        except (ValueError, TypeError, OverflowError):
+            return  # a constraint type or value that cannot be coded, the model is rebuilt each time
+        for stale in glob.glob(glob.escape(self.db_path) + ".*.csp"):
+            if not stale.startswith("%s.%s." % (self.db_path, key)):
+                self._remove(stale)
+        try:
+            with open(path + ".tmp", "wb") as file:
+                file.write(data)
+            os.replace(path + ".tmp", path)  # a model is never read half written
+        except OSError:
+            self._remove(path + ".tmp")  # the cache only saves time, a read-only folder is not an error
+
+    def _encode(self, csp) -> bytes:
+        variables: List = list(csp.variables)
+        index: Dict = {var: i for i, var in enumerate(variables)}
+        fields: List[tuple] = [tuple(self.fields(var)) for var in variables]
+        width: int = len(fields[0]) if fields else 0
+        domain_ids: Dict[int, int] = {}  # keyed by id, variables sharing a domain list share its entry
+        domains: List[list] = []
+        for var in variables:
+            if id(csp.domains[var]) not in domain_ids:
+                domain_ids[id(csp.domains[var])] = len(domains)
+                domains.append(csp.domains[var])
+        constraints: List = []
+        added: set = set()
+        for var in variables:
+            for constraint in csp.constraints[var]:
+                if id(constraint) not in added:
+                    added.add(id(constraint))
+                    constraints.append(constraint)
+        words: array = array("i", (MAGIC, VERSION, len(variables), width, len(domains), len(constraints),
+                                   len(csp.tables)))
+        for var_fields in fields:
+            words.extend(var_fields)
+        words.extend(domain_ids[id(csp.domains[var])] for var in variables)
+        for domain in domains:
+            words.append(len(domain))
+            words.extend(domain)
+        for constraint in constraints:
+            parameters: tuple = tuple(getattr(constraint, "parameters", ()))
+            words.extend((self.constraint_types.index(type(constraint)), len(constraint.variables), len(parameters)))
+            words.extend(index[var] for var in constraint.variables)
+            words.extend(parameters)
+        data: bytearray = bytearray(words.tobytes())
+        for (a, c), rows in csp.tables.items():
+            row_words: int = (len(csp.domains[c]) + 31) // 32
+            data += array("i", (index[a], index[c], len(rows), row_words)).tobytes()
+            for row in rows:
+                data += row.to_bytes(row_words * 4, "little")
+        return bytes(data)
+
+    def _decode(self, view: memoryview, words: memoryview) -> tuple:
+        if words[0] != MAGIC or words[1] != VERSION:
+            raise ValueError("Not a model cache file of version %d" % VERSION)
+        num_vars, width, num_domains, num_constraints, num_tables = words[2:HEADER]
+        pos: int = HEADER
+        variables: List = [self.variable_type(*words[pos + i * width:pos + (i + 1) * width])
+                           for i in range(num_vars)]
+        pos += num_vars * width
+        domain_ids: List[int] = words[pos:pos + num_vars].tolist()
+        pos += num_vars
+        domain_list: List[tuple] = []
+        for _ in range(num_domains):
+            domain_list.append(tuple(words[pos + 1:pos + 1 + words[pos]].tolist()))
+            pos += 1 + words[pos]
+        domains: Dict = {var: domain_list[domain_id] for var, domain_id in zip(variables, domain_ids)}
+        constraints: List = []
+        for _ in range(num_constraints):
+            constraint_type: type = self.constraint_types[words[pos]]
+            length, num_parameters = words[pos + 1], words[pos + 2]
+            scope: List = [variables[i] for i in words[pos + 3:pos + 3 + length]]
+            pos += 3 + length
+            if hasattr(constraint_type, "from_parameters"):
+                constraints.append(constraint_type.from_parameters(scope, words[pos:pos + num_parameters].tolist()))
+            else:
+                constraints.append(constraint_type(scope))
+            pos += num_parameters
+        tables: Dict[tuple, List[int]] = {}
+        for _ in range(num_tables):
+            a, c, num_rows, row_words = words[pos:pos + 4]
+            pos += 4
+            tables[(variables[a], variables[c])] = [
+                int.from_bytes(view[(pos + i * row_words) * 4:(pos + (i + 1) * row_words) * 4], "little")
+                for i in range(num_rows)]
+            pos += num_rows * row_words
+        if pos != len(words):
+            raise ValueError("Model cache file has %d trailing words" % (len(words) - pos))
+        return variables, domains, constraints, tables
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+if __name__ == '__main__':
+    pass
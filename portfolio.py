@@ -0,0 +1,238 @@
+from typing import Callable, Dict, List, Optional, Set, Any
+from itertools import count
+import multiprocessing as mp
+import queue
+import random
+
+
+DEFAULT_CONFIGURATIONS: List[Dict[str, Any]] = [
+    {"fc": True, "ordering": "dom/wdeg"},
+    {"fc": True, "ordering": "mrv"},
+    {"fc": True, "ordering": "dom/wdeg", "cbj": True},
+    {"fc": True, "ordering": "dom/deg"},
+]
+
+TIMETABLE_CONFIGURATIONS: List[Dict[str, Any]] = [
+    {"ordering": "dom/wdeg"},
+    {"ordering": "mrv"},
+    {},
+]
+
+WAIT_INTERVAL: float = 0.5  # seconds between the calls of on_progress while solve_components waits
+
+
+def luby(i: int) -> int:
+    """Returns the ith term (from 1) of the Luby sequence 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, ..."""
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    while i != (1 << k) - 1:  # i is inside the sequence that ends at 2^k - 1, which repeats the earlier terms
+        i -= (1 << (k - 1)) - 1
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+    return 1 << (k - 1)
+
+
+def _search_variables(csp) -> List:
+    """The variables of a constraintframework CSP or the classes of a timetableconstraintframework CSP"""
+    return csp.variables if hasattr(csp, "variables") else csp.classes
+
+
+def _set_search_variables(csp, variables: List) -> None:
+    if hasattr(csp, "variables"):
+        csp.variables = variables
+    else:
+        csp.classes = variables
+
+
+def restart_search(csp, seed: int = 0, base_nodes: int = 100, **search_kwargs) -> Optional[Dict]:
+    """Runs backtracking_search with Luby restarts, the ith run is cut off after luby(i) * base_nodes
+    assignments. Each run shuffles the variable order so ties and random choices differ between runs, all
+    drawn from one random.Random(seed). The variable ordering is kept between runs, so dom/wdeg weights
+    carry over. The variable order of csp is restored afterwards.
+    Returns the solution, or None once a run proves there is none"""
+    rng: random.Random = random.Random(seed)
+    variables: List = list(_search_variables(csp))
+    order: List = variables[:]
+    csp_rng: Optional[random.Random] = csp.rng
+    csp.rng = rng
+    try:
+        for run in count(1):
+            rng.shuffle(order)
+            _set_search_variables(csp, order[:])
+            solution: Optional[Dict] = csp.backtracking_search(max_nodes=luby(run) * base_nodes, **search_kwargs)
+            if not csp.paused:
+                return solution
+            if csp.ordering is not None:
+                search_kwargs["ordering"] = csp.ordering
+    finally:
+        _set_search_variables(csp, variables)
+        csp.rng = csp_rng
+
+
+def _portfolio_worker(job: tuple) -> Optional[list]:
+    """Runs one restarting search in a worker process, returns the values in the original variable order"""
+    csp, seed, base_nodes, configuration = job
+    variables: List = list(_search_variables(csp))
+    if configuration.get("cbj") and "nogoods" not in configuration:
+        from constraintframework import NogoodStore
+        configuration = dict(configuration, nogoods=NogoodStore())  # shared by the restarts of this worker
+    solution: Optional[Dict] = restart_search(csp, seed, base_nodes, **configuration)
+    if solution is None:
+        return None
+    return [solution[var] for var in variables]
+
+
+def solve_portfolio(csp, configurations: List[Dict[str, Any]] = None, processes: int = None, seed: int = 0,
+                    base_nodes: int = 100, timeout: float = None) -> Optional[Dict]:
+    """Starts a differently seeded restarting search for each process, cycling through the configurations
+    (keyword arguments of backtracking_search). The first search to finish decides the result and the
+    others are terminated. Returns None if there is no solution or the timeout in seconds runs out"""
+    if configurations is None:
+        configurations = DEFAULT_CONFIGURATIONS if hasattr(csp, "variables") else TIMETABLE_CONFIGURATIONS
+    processes = processes or mp.cpu_count()
+    variables: List = list(_search_variables(csp))
+    jobs = [(csp, seed + i, base_nodes, configurations[i % len(configurations)]) for i in range(processes)]
+    pool = mp.Pool(processes)
+    try:
+        results = pool.imap_unordered(_portfolio_worker, jobs)
+        try:
+            values: Optional[list] = results.next(timeout)
+        except mp.TimeoutError:
+            return None
+    finally:
+        pool.terminate()
+        pool.join()
+    if values is None:
+        return None
+    return dict(zip(variables, values))
+
+
+_worker_channel: Optional[tuple] = None  # progress queue and stop event of a component worker process
+
+
+def _init_component_worker(progress: mp.Queue, stop: mp.Event) -> None:
+    global _worker_channel
+    _worker_channel = (progress, stop)
+
+
+def _report_to_channel(index: int, placed: int, nodes: int) -> bool:
+    """Sends the progress of a worker's search, returns False once the search should stop"""
+    progress, stop = _worker_channel
+    progress.put((index, placed, nodes))
+    return not stop.is_set()
+
+
+def _component_worker(job: tuple, report: Callable[[int, int, int], bool] = None) -> tuple:
+    """Solves one component, returns its index, its values in variable order, its statistics and the number
+    of assignments made. Values are returned by position as a worker process only has copies of the
+    variables. Given chunk_nodes, the search pauses every chunk_nodes assignments to report the variables
+    placed and the nodes so far, and stops without a solution if the report returns False. In a worker
+    process the reports go to the channel"""
+    index, csp, search_kwargs, chunk_nodes = job
+    if chunk_nodes is None:
+        solution: Optional[Dict] = csp.backtracking_search(**search_kwargs)
+    else:
+        report = report or _report_to_channel
+        solution = csp.backtracking_search(max_nodes=chunk_nodes, **search_kwargs)
+        while csp.paused:
+            if not report(index, len(csp.search_assignment), csp.num_assigns):
+                return index, None, csp.stats, csp.num_assigns
+            solution = csp.resume_search(chunk_nodes)
+    values: Optional[list] = None if solution is None else [solution[var] for var in csp.variables]
+    return index, values, csp.stats, csp.num_assigns
+
+
+def _next_result(results, on_wait: Callable[[], None]) -> tuple:
+    """Waits for the next result of imap_unordered, calling on_wait every WAIT_INTERVAL seconds until it is ready"""
+    while True:
+        try:
+            return results.next(WAIT_INTERVAL)
+        except mp.TimeoutError:
+            on_wait()
+
+
+def solve_components(csp, processes: int = None, on_progress: Callable[[int, int], None] = None,
+                     chunk_nodes: int = 1000, **search_kwargs) -> Optional[Dict]:
+    """Splits a constraintframework CSP into components that share no constraint and solves them
+    concurrently, one backtracking_search (given search_kwargs) per component. Resources shared between
+    components, such as teachers taking classes in several years, must be constraints of the CSP or the
+    merged solution may double book them. Statistics are merged into csp.stats when it is enabled.
+    on_progress is called with the number of variables placed and of nodes searched over all components:
+    after every chunk_nodes nodes of each search, as each component is solved and every WAIT_INTERVAL
+    seconds while worker processes are busy. An exception raised by it stops the searches.
+    Returns the merged solution, or None as soon as a component has none"""
+    subproblems: List = [csp.subproblem(component) for component in csp.components()]
+    for subproblem in subproblems:
+        subproblem.stats.enabled = csp.stats.enabled
+    if csp.stats.enabled:
+        csp.stats.reset()
+    if on_progress is None or "max_nodes" in search_kwargs or not search_kwargs.get("iterative", True):
+        chunk_nodes = None  # only an iterative search can pause to report
+    jobs = [(index, subproblem, search_kwargs, chunk_nodes) for index, subproblem in enumerate(subproblems)]
+    searching: Dict[int, tuple] = {}  # variables placed and nodes last reported by each search still running
+    solved: List[int] = [0, 0]  # variables placed and nodes of the components solved
+
+    def report(index: int = None, placed: int = 0, nodes: int = 0) -> bool:
+        if index is not None:
+            searching[index] = (placed, nodes)
+        on_progress(solved[0] + sum(placed for placed, _ in searching.values()),
+                    solved[1] + sum(nodes for _, nodes in searching.values()))
+        return True
+
+    def report_workers() -> None:
+        try:
+            while True:
+                index, placed, nodes = channel[0].get_nowait()
+                if index not in done:  # a report can arrive after the result of its component
+                    searching[index] = (placed, nodes)
+        except queue.Empty:
+            pass
+        report()
+
+    done: Set[int] = set()
+    channel: Optional[tuple] = None
+    pool = None
+    if processes != 1 and len(jobs) > 1:
+        if chunk_nodes is not None:
+            channel = (mp.Queue(), mp.Event())
+            pool = mp.Pool(processes, _init_component_worker, channel)
+        else:
+            pool = mp.Pool(processes)
+    solution: Optional[Dict] = {}
+    try:
+        if pool is None:
+            results = (_component_worker(job, report if chunk_nodes is not None else None) for job in jobs)
+        else:
+            results = pool.imap_unordered(_component_worker, jobs)
+        for _ in jobs:
+            if pool is None or on_progress is None:
+                index, values, stats, nodes = next(results)
+            else:
+                index, values, stats, nodes = _next_result(results, report_workers if channel is not None else report)
+            done.add(index)
+            searching.pop(index, None)
+            if csp.stats.enabled:
+                csp.stats.merge(stats)
+            if values is None:
+                solution = None
+                break
+            solution.update(zip(subproblems[index].variables, values))
+            solved[0] += len(values)
+            solved[1] += nodes
+            if on_progress is not None:
+                report()
+    finally:
+        if channel is not None:
+            channel[1].set()  # workers still searching stop at their next report
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    if csp.stats.enabled:
+        csp.stats.stop()
+    return solution
+
+
+if __name__ == '__main__':
+    pass
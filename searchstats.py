@@ -0,0 +1,120 @@
+from typing import Callable, Dict, List, Optional
+from collections import Counter
+from timeit import default_timer as timer
+
+
+class SearchStats:
+    """Counters and timers collected by a solver. Nothing is collected unless enabled, so a disabled
+    instance only costs the solver one attribute check per event"""
+    EVENTS = ("node", "backtrack", "solution")
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.hooks: Dict[str, List[list]] = {event: [] for event in self.EVENTS}  # [callback, every, calls]
+        self.nodes, self.backtracks, self.prunings, self.max_depth = 0, 0, 0, 0
+        self.checks: Counter = Counter()  # constraint checks keyed by constraint class name
+        self.propagation_time = 0.0
+        self.start_time: Optional[float] = None
+        self.end_time: Optional[float] = None
+
+    def __repr__(self) -> str:
+        return "SearchStats(" + ", ".join("%s=%s" % item for item in self.as_dict().items()) + ")"
+
+    def reset(self) -> None:
+        """Clears the counters and starts the clock, hooks are kept"""
+        self.nodes, self.backtracks, self.prunings, self.max_depth = 0, 0, 0, 0
+        self.checks = Counter()
+        self.propagation_time = 0.0
+        self.start_time, self.end_time = timer(), None
+
+    def stop(self) -> None:
+        """Stops the clock at the end of a search"""
+        self.end_time = timer()
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the search started, or its total duration once stopped"""
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time if self.end_time is not None else timer()) - self.start_time
+
+    @property
+    def search_time(self) -> float:
+        """Seconds spent choosing and trying values rather than propagating"""
+        return self.elapsed - self.propagation_time
+
+    @property
+    def nodes_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.nodes / elapsed if elapsed else 0.0
+
+    def merge(self, other: "SearchStats") -> None:
+        """Adds the counters of a search run elsewhere, such as in a worker process. The clock is kept"""
+        self.nodes += other.nodes
+        self.backtracks += other.backtracks
+        self.prunings += other.prunings
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.checks.update(other.checks)
+        self.propagation_time += other.propagation_time
+
+    def add_hook(self, event: str, callback: Callable[["SearchStats", object], None], every: int = 1) -> None:
+        """Calls callback(stats, solver) on every nth occurrence of event, every > 1 samples the search"""
+        if event not in self.hooks:
+            raise LookupError("Unknown event '%s', expected one of %s" % (event, ", ".join(self.EVENTS)))
+        self.hooks[event].append([callback, every, 0])
+
+    def node(self, depth: int, solver: object) -> None:
+        """Records an assignment made at depth"""
+        self.nodes += 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if self.hooks["node"]:
+            self._emit("node", solver)
+
+    def backtrack(self, solver: object) -> None:
+        """Records an assignment being undone"""
+        self.backtracks += 1
+        if self.hooks["backtrack"]:
+            self._emit("backtrack", solver)
+
+    def solution(self, solver: object) -> None:
+        """Records the end of a search, solution or not"""
+        self.stop()
+        if self.hooks["solution"]:
+            self._emit("solution", solver)
+
+    def _emit(self, event: str, solver: object) -> None:
+        """Runs the hooks of event that are due"""
+        for hook in self.hooks[event]:
+            hook[2] += 1
+            if hook[2] % hook[1] == 0:
+                hook[0](self, solver)
+
+    def as_dict(self) -> dict:
+        """Returns the statistics as a dictionary"""
+        return {"nodes": self.nodes, "backtracks": self.backtracks, "prunings": self.prunings,
+                "max_depth": self.max_depth, "checks": dict(self.checks), "elapsed": round(self.elapsed, 6),
+                "propagation_time": round(self.propagation_time, 6), "search_time": round(self.search_time, 6),
+                "nodes_per_second": round(self.nodes_per_second, 1)}
+
+    def report(self) -> str:
+        """Returns the statistics as readable lines"""
+        lines = ["Nodes: %d (%.1f per second)" % (self.nodes, self.nodes_per_second),
+                 "Backtracks: %d" % self.backtracks,
+                 "Prunings: %d" % self.prunings,
+                 "Max depth: %d" % self.max_depth,
+                 "Time: %.4fs (search %.4fs, propagation %.4fs)" % (self.elapsed, self.search_time,
+                                                                    self.propagation_time)]
+        for name, num_checks in self.checks.most_common():
+            lines.append("Checks %s: %d" % (name, num_checks))
+        return "\n".join(lines)
+
+
+def print_progress(stats: SearchStats, solver: object) -> None:
+    """Hook printing a one line summary, add with every set to sample a long search"""
+    print("%d nodes, %d backtracks, depth %d, %.1f nodes per second"
+          % (stats.nodes, stats.backtracks, stats.max_depth, stats.nodes_per_second))
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,106 @@
+from constraintframework import *
+from variableordering import DomWDegOrdering
+from twophase import PeriodCapacityConstraint
+from collections import Counter
+import pytest
+import random
+
+
+class NotEqualConstraint(BinaryConstraint[int, int]):
+    def compatible(self, val1: int, val2: int) -> bool:
+        return val1 != val2
+
+
+def _random_csp(seed: int, domain_type: type = ListDomain) -> CSP[int, int]:
+    """A graph colouring with some edges ordered instead, dense enough that some have no solution"""
+    rng: random.Random = random.Random(seed)
+    num_vars, num_colours, density = rng.choice([(14, 3, 0.3), (16, 3, 0.25), (12, 4, 0.5), (18, 3, 0.22)])
+    variables: List[int] = list(range(num_vars))
+    csp: CSP[int, int] = CSP(domain_type)
+    csp.set_domains(variables, {var: list(range(num_colours)) for var in variables})
+    for var1 in variables:
+        for var2 in variables[var1 + 1:]:
+            if rng.random() < density:
+                constraint_type: type = LessEqualConstraint if rng.random() < 0.2 else NotEqualConstraint
+                csp.add_constraint(constraint_type([var1, var2]))
+    return csp
+
+
+def test_dom_wdeg_weights_constraints_with_unassigned_variables():
+    """A failed arc weighs on both its variables, but only while the other one is unassigned"""
+    neighbours: Dict[str, Set[str]] = {"a": {"b", "c"}, "b": {"a"}, "c": {"a"}}
+    sizes: Dict[str, int] = {"a": 3, "b": 2, "c": 2}
+    ordering: DomWDegOrdering = DomWDegOrdering(list(neighbours), sizes.get, lambda var: len(neighbours[var]),
+                                                neighbours.get)
+    assert ordering.select({}) == "a"  # 3 / 2 before 2 / 1
+    ordering.failure("b", "a")
+    ordering.failure("b", "a")
+    assert ordering.select({}) == "b"  # 2 / 3 before 3 / 4
+    assert ordering.select({"b": 0}) == "c"  # the arc to b no longer counts for a, 2 / 1 before 3 / 1
+    ordering.touch("b")
+    assert ordering.select({}) == "b"
+
+
+def test_all_different_prunes_values_outside_every_matching():
+    """Arc consistency removes nothing here, matching prunes c to 3 which then leaves d with 6"""
+    domains: Dict[str, List[int]] = {"a": [1, 2], "b": [1, 2], "c": [1, 2, 3], "d": [3, 4, 5, 6], "e": [4, 5],
+                                     "f": [4, 5]}
+    csp: CSP[str, int] = CSP()
+    csp.set_domains(list(domains), domains)
+    csp.add_constraint(AllDifferentConstraint(["a", "b", "c"]))
+    csp.add_constraint(AllDifferentConstraint(["c", "d", "e", "f"]))
+    csp._initialise_current_domains()
+    assert csp._AC3() and all(len(csp.current_domains[var]) == len(domains[var]) for var in domains)
+    assert csp._propagate_global_constraints({})
+    assert {var: sorted(csp.current_domains[var]) for var in domains} == \
+        {"a": [1, 2], "b": [1, 2], "c": [3], "d": [6], "e": [4, 5], "f": [4, 5]}
+
+
+@pytest.mark.parametrize("search_kwargs", [{}, {"iterative": False}, {"fc": True}, {"cbj": True},
+                                           {"fc": True, "ordering": "dom/wdeg", "cbj": True}])
+def test_searches_respect_constraints_that_are_not_pairwise(search_kwargs):
+    variables: List[int] = list(range(6))
+    csp: CSP[int, int] = CSP()
+    csp.set_domains(variables, {var: [1, 2, 3] for var in variables})
+    csp.add_constraint(PeriodCapacityConstraint(variables, 2))
+    solution: Dict[int, int] = csp.backtracking_search(**search_kwargs)
+    assert len(solution) == 6 and max(Counter(solution.values()).values()) == 2
+    csp.add_constraint(PeriodCapacityConstraint(variables[:4], 1))
+    assert csp.backtracking_search(**search_kwargs) is None
+
+
+def test_local_search_respects_constraints_that_are_not_pairwise():
+    variables: List[int] = list(range(6))
+    csp: CSP[int, int] = CSP()
+    csp.set_domains(variables, {var: [1, 2, 3] for var in variables})
+    csp.add_constraint(PeriodCapacityConstraint(variables, 2))
+    solution: Dict[int, int] = csp.local_search(seed=0)
+    assert len(solution) == 6 and max(Counter(solution.values()).values()) == 2
+
+
+def test_break_symmetries_only_chains_variables_that_can_be_swapped():
+    domains: Dict[str, List[int]] = {var: [1, 2, 3] for var in ("x", "y", "p", "q", "z")}
+    csp: CSP[str, int] = CSP()
+    csp.set_domains(list(domains), domains)
+    csp.add_constraint(LessEqualConstraint(["y", "x"]))  # swapping x and y reverses it
+    csp.add_constraint(AllDifferentConstraint(["p", "z"]))  # swapping p and q maps one onto the other
+    csp.add_constraint(AllDifferentConstraint(["q", "z"]))
+    assert csp.break_symmetries(lambda var: var in "xy" or None, lambda var: var in "pq" or None) == 1
+    assert [constraint.variables for constraint in csp.constraints["x"]] == [["y", "x"]]
+    assert [constraint.variables for constraint in csp.constraints["q"]][-1] == ["p", "q"]
+
+
+@pytest.mark.parametrize("search_kwargs", [{"cbj": True}, {"cbj": True, "fc": True},
+                                           {"cbj": True, "fc": True, "ordering": "dom/wdeg"}])
+def test_cbj_agrees_with_backtracking(search_kwargs):
+    """Backjumping and the nogoods it learns never cut off a solution or let a broken constraint through"""
+    for seed in range(40):
+        expected: bool = _random_csp(seed).backtracking_search() is not None
+        nogoods: NogoodStore = NogoodStore(50)  # small enough to evict, shared by a second search
+        for domain_type in (ListDomain, BitsetDomain, BitsetDomain):
+            csp: CSP[int, int] = _random_csp(seed, domain_type)
+            solution: Optional[Dict[int, int]] = csp.backtracking_search(nogoods=nogoods, **search_kwargs)
+            assert (solution is not None) == expected, seed
+            if solution is not None:
+                assert len(solution) == len(csp.variables)
+                assert all(csp._num_conflicts(var, val, solution) == 0 for var, val in solution.items())
@@ -0,0 +1,146 @@
+from timetabling import *
+import os
+import shutil
+
+
+def _curriculum_csp(clss_distribution: tuple, req_prds: int) -> CurriculumCSP:
+    """A curriculum CSP of one year with one subject, built without a database"""
+    csp: CurriculumCSP = CurriculumCSP(None)
+    csp.periods = list(range(1, 11))
+    index: Dict[int, int] = {prd: i for i, prd in enumerate(csp.periods)}
+    year: Year = Year(1, False)
+    year.num_clss = sum(clss_distribution)
+    year.prd_clss = Periods.from_counts(index, {})
+    subject: Subject = Subject(1, req_prds, len(clss_distribution))
+    subject.sbjt_prds = Periods.from_counts(index, {})
+    subject.clss_distribution = clss_distribution
+    year.subjects[subject.id] = subject
+    csp.years[year.id] = year
+    return csp
+
+
+def test_class_symmetry_chain():
+    """The classes of a set are ordered by their first lessons as well as the lessons of each class"""
+    csp: CurriculumCSP = _curriculum_csp((3,), 2)
+    csp._set_variables(ClassVariable.lesson_key, ClassVariable.class_key)
+    chains: List[tuple] = [tuple((var.cls_num, var.cls_prd_num) for var in constraint.variables)
+                           for constraint in {id(c): c for var in csp.variables for c in csp.constraints[var]}.values()
+                           if isinstance(constraint, LessEqualConstraint)]
+    assert sorted(chains) == [((0, 0), (0, 1)), ((0, 0), (1, 0)), ((1, 0), (1, 1)), ((1, 0), (2, 0)),
+                              ((2, 0), (2, 1))]
+
+
+def test_class_lessons_all_different():
+    """Every class keeps its AllDifferent over its lessons"""
+    csp: CurriculumCSP = _curriculum_csp((3,), 2)
+    csp._set_variables(ClassVariable.lesson_key, ClassVariable.class_key)
+    assert sum(isinstance(constraint, AllDifferentConstraint) for constraint in csp.global_constraints) == 3
+    solution: Optional[Dict[ClassVariable, int]] = csp.backtracking_search(fc=True)
+    assert solution is not None
+    for cls in range(3):
+        assert len({prd for var, prd in solution.items() if var.cls_num == cls}) == 2
+
+
+def test_no_period_over_capacity():
+    """No period holds more lessons of the subject than it has teachers, or of the year than it has classes"""
+    csp: CurriculumCSP = _curriculum_csp((3, 2, 2), 4)
+    solution: Optional[Dict[ClassVariable, int]] = csp.config_csp(processes=1)
+    assert solution is not None and len(solution) == 28
+    counts: Counter = Counter(solution.values())
+    assert max(counts.values()) <= min(csp.years[1].subjects[1].num_tchrs, csp.years[1].num_clss) == 3
+
+
+def _model_cache(path: str) -> ModelCache:
+    return ModelCache(path, lambda var: (var.sbjt, var.set_num, var.cls_num, var.cls_prd_num, var.yr), ClassVariable,
+                      (AllDifferentConstraint, LessEqualConstraint, CapacityConstraint))
+
+
+def test_model_cache_round_trip(tmp_path):
+    """A cached model has the same variables, domains, constraints and tables as the one it was built from"""
+    csp: CurriculumCSP = _curriculum_csp((3, 2, 2), 4)
+    csp._set_variables(ClassVariable.lesson_key, ClassVariable.class_key)
+    csp.compile_constraints()
+    cache: ModelCache = _model_cache(str(tmp_path / "main.db"))
+    key: str = model_key(csp.MODEL_VERSION, csp._model_inputs())
+    cache.save(csp, key, "lesson_key-class_key")
+    loaded: CurriculumCSP = _curriculum_csp((3, 2, 2), 4)
+    assert cache.load(loaded, key, "lesson_key-class_key")
+
+    def model(model_csp: CurriculumCSP) -> tuple:
+        constraints: Dict[int, Constraint] = {id(constraint): constraint for var in model_csp.variables
+                                              for constraint in model_csp.constraints[var]}
+        return ([repr(var) for var in model_csp.variables],
+                [tuple(model_csp.domains[var]) for var in model_csp.variables],
+                sorted((type(constraint).__name__, repr(constraint.variables), getattr(constraint, "parameters", ()))
+                       for constraint in constraints.values()),
+                sorted((repr(a), repr(c), tuple(rows)) for (a, c), rows in model_csp.tables.items()))
+
+    assert model(loaded) == model(csp)
+    assert loaded.backtracking_search(fc=True, ordering="dom/wdeg") is not None
+
+
+def test_model_cache_key_follows_the_data(tmp_path):
+    """Changing the data changes the key, a model saved under the new key evicts the old one"""
+    csp: CurriculumCSP = _curriculum_csp((3, 2, 2), 4)
+    csp._set_variables()
+    cache: ModelCache = _model_cache(str(tmp_path / "main.db"))
+    key: str = model_key(csp.MODEL_VERSION, csp._model_inputs())
+    assert key == model_key(csp.MODEL_VERSION, _curriculum_csp((3, 2, 2), 4)._model_inputs())
+    cache.save(csp, key, "none")
+    assert model_key(csp.MODEL_VERSION + 1, csp._model_inputs()) != key  # a new model is never read as the old
+    csp.years[1].subjects[1].num_tchrs = 4
+    new_key: str = model_key(csp.MODEL_VERSION, csp._model_inputs())
+    assert new_key != key
+    assert not cache.load(_curriculum_csp((3, 2, 2), 4), new_key, "none")
+    csp._set_variables()
+    cache.save(csp, new_key, "none")
+    assert not os.path.exists(cache.path(key, "none")) and os.path.exists(cache.path(new_key, "none"))
+
+
+def test_save_solution_rejects_unknown_periods():
+    """A period outside the grid is never written to class_placement"""
+    csp: CurriculumCSP = _curriculum_csp((1,), 1)
+    csp._set_variables()
+    try:
+        csp.save_solution({csp.variables[0]: 11})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Period 11 is not in the grid")
+
+
+def test_save_solution_keeps_lessons_that_did_not_move(tmp_path):
+    """Moving one lesson of a class rewrites only that lesson, the others keep their teacher and classroom"""
+    filepath: str = str(tmp_path / "main.db")
+    shutil.copyfile(os.path.join(os.path.dirname(os.path.abspath(__file__)), "Main Database"), filepath)
+    database: MainDatabase = MainDatabase("file:" + filepath)
+    csp: CurriculumCSP = CurriculumCSP(database)
+    csp.config_data()
+    for year in csp.years.values():
+        for subject in year.subjects.values():
+            subject.req_prds = 2
+    csp._set_variables()
+    previous: Dict[ClassVariable, int] = csp.load_solution()
+    var: ClassVariable = next(var for var in previous if var.cls_prd_num == 1)
+    cls_id: int = csp._class_ids()[(var.yr, var.sbjt, var.set_num)][var.cls_num]
+    lessons: List[int] = [prd for cls, prd in database.get_class_placements() if cls == cls_id]
+    teacher: int = database.cursor.execute("""SELECT min(Teacher_ID) FROM teachers WHERE Teacher_ID NOT IN
+                                              (SELECT Teacher_ID FROM class_placement WHERE Teacher_ID IS NOT NULL)"""
+                                           ).fetchone()[0]
+    database.cursor.execute("UPDATE class_placement SET Teacher_ID = ? WHERE Class_ID = ?",
+                            (teacher, cls_id))
+    database.connection.commit()
+    solution: Dict[ClassVariable, int] = dict(previous)
+    solution[var] = next(prd for prd in csp.periods if prd not in lessons)
+    csp.save_solution(solution, previous)
+    rows: Dict[int, object] = dict(database.cursor.execute(
+        "SELECT Period_ID, Teacher_ID FROM class_placement WHERE Class_ID = ?", (cls_id,)).fetchall())
+    database.close_database()
+    assert rows == {prd: None if other is var else teacher
+                    for other, prd in solution.items() if other.lesson_key() == var.lesson_key()}
+
+
+if __name__ == '__main__':
+    test_class_symmetry_chain()
+    test_class_lessons_all_different()
+    test_save_solution_rejects_unknown_periods()
@@ -1,6 +1,12 @@
-from typing import Generic, TypeVar, Dict, List, Tuple, Optional
+from typing import Generic, TypeVar, Callable, Collection, Dict, Hashable, List, Set, Tuple, Optional, Iterator
 from abc import ABC, abstractmethod
-from random import choice
+from array import array
+from random import choice, Random
+from timeit import default_timer as timer
+from constraintframework import Stack, DisjointSet, BitsetDomain
+from variableordering import VariableOrdering, create_ordering
+from searchstats import SearchStats
+from matching import hopcroft_karp
 
 C = TypeVar("C")
 T = TypeVar("T")
@@ -10,6 +16,8 @@ P = TypeVar("P")
 
 class Constraint(Generic[C, P, T, R], ABC):
     """Framework for a constraint"""
+    periods_only: bool = False  # True if satisfied only compares periods, which the two phase solver needs
+
     def __init__(self, classes: List[C]) -> None:
         self.classes = classes
 
@@ -22,11 +30,153 @@ class Constraint(Generic[C, P, T, R], ABC):
         ...
 
 
+class SamePeriodConstraint(Constraint[C, P, T, R]):
+    """Makes sure the classes share a period. Before a search the classes are merged into one search
+    variable, so the set is placed as a whole rather than class by class"""
+    periods_only = True
+
+    def satisfied(self, cls1: C, prd1: P, tchr1: T, rm1: R, cls2: C, prd2: P, tchr2: T, rm2: R) -> bool:
+        return prd1 == prd2
+
+
+class GlobalConstraint(Constraint[C, P, T, R], ABC):
+    """Framework for an n-ary constraint that can rule out a partial timetable as a whole,
+    satisfied still checks pairs of classes"""
+    @abstractmethod
+    def feasible(self, csp: "CSP") -> bool:
+        """Needs to be overwritten, returns False if the placed classes leave the constraint unsatisfiable"""
+        ...
+
+
+class AllDifferentConstraint(GlobalConstraint[C, P, T, R]):
+    """Every class takes a different period. The classes are matched to the periods of their domains,
+    so a band with fewer periods than classes fails as soon as it is checked"""
+    periods_only = True
+
+    def __init__(self, classes: List[C]) -> None:
+        super().__init__(classes)
+        self.matching: Dict[C, P] = {}  # last matching found, the next one starts from it
+
+    def satisfied(self, cls1: C, prd1: P, tchr1: T, rm1: R, cls2: C, prd2: P, tchr2: T, rm2: R) -> bool:
+        return prd1 != prd2
+
+    def feasible(self, csp: "CSP") -> bool:
+        adjacency = {cls: (csp.assignment[cls][0],) if cls in csp.assignment else csp._period_domain(cls)
+                     for cls in self.classes}
+        matching: Dict[C, P] = hopcroft_karp(adjacency, self.matching)
+        if len(matching) < len(self.classes):
+            return False
+        self.matching = matching
+        return True
+
+
+class SoftConstraint(Constraint[C, P, T, R], ABC):
+    """Framework for a preference rather than a requirement, it never rules a timetable out but costs weight
+    for each violation. times gives the day and the position within the day of each period"""
+    def __init__(self, classes: List[C], times: Dict[P, Tuple[Hashable, int]], weight: float = 1) -> None:
+        super().__init__(classes)
+        self.times = times
+        self.weight = weight
+
+    def satisfied(self, cls1: C, prd1: P, tchr1: T, rm1: R, cls2: C, prd2: P, tchr2: T, rm2: R) -> bool:
+        return True
+
+    @abstractmethod
+    def violations(self, csp: "CSP") -> int:
+        """Needs to be overwritten, returns the number of violations among the placed classes. It must never
+        exceed the violations of any way of placing the rest, so that it bounds the cost of a partial timetable"""
+        ...
+
+    def _days(self, csp: "CSP", key: Callable[[Tuple[P, T, R]], Hashable]) -> Dict[tuple, List[Tuple[int, R]]]:
+        """Groups the positions and classrooms of the placed classes by key and day, sorted by position"""
+        days: Dict[tuple, List[Tuple[int, R]]] = {}
+        for cls in self.classes:
+            values: Optional[Tuple[P, T, R]] = csp.assignment.get(cls)
+            if values is not None:
+                day, position = self.times[values[0]]
+                days.setdefault((key(values), day), []).append((position, values[2]))
+        for lessons in days.values():
+            lessons.sort()
+        return days
+
+
+class TeacherGapsConstraint(SoftConstraint[C, P, T, R]):
+    """Every free period a teacher has between two lessons of the same day is a violation. Each class
+    still to be placed can fill at most one gap, so they are taken off the gaps of the placed classes"""
+    def violations(self, csp: "CSP") -> int:
+        gaps: int = 0
+        num_placed: int = 0
+        for lessons in self._days(csp, lambda values: values[1]).values():
+            gaps += lessons[-1][0] - lessons[0][0] + 1 - len(lessons)
+            num_placed += len(lessons)
+        return max(0, gaps - (len(self.classes) - num_placed))
+
+
+class ClassroomChangesConstraint(SoftConstraint[C, P, T, R]):
+    """A teacher moving to a different classroom between two lessons in a row is a violation"""
+    def violations(self, csp: "CSP") -> int:
+        changes: int = 0
+        for lessons in self._days(csp, lambda values: values[1]).values():
+            for (position1, clsrm1), (position2, clsrm2) in zip(lessons, lessons[1:]):
+                if position2 == position1 + 1 and clsrm1 != clsrm2:
+                    changes += 1
+        return changes
+
+
+class SameDayConstraint(SoftConstraint[C, P, T, R]):
+    """Every lesson of the classes after the first on the same day is a violation, spreading the lessons
+    of a subject over the week"""
+    def violations(self, csp: "CSP") -> int:
+        return sum(len(lessons) - 1 for lessons in self._days(csp, lambda values: None).values())
+
+
+class OccupancyMatrix:
+    """Read only periods x teachers x classrooms view of the occupancy arrays of a CSP,
+    matrix[prd][tchr][clsrm] is the class placed there or None"""
+    def __init__(self, csp: "CSP", key: tuple = ()) -> None:
+        self.csp = csp
+        self.key = key  # the period, then the teacher, selected so far
+
+    def __repr__(self) -> str:
+        return "OccupancyMatrix" + str(self.key)
+
+    def _level(self) -> Dict:
+        """Index of the periods, teachers or classrooms selected by the next subscript"""
+        return (self.csp.prd_index, self.csp.tchr_index, self.csp.clsrm_index)[len(self.key)]
+
+    def __len__(self) -> int:
+        return len(self._level())
+
+    def __iter__(self) -> Iterator:
+        return iter(self._level())
+
+    def __getitem__(self, item: object) -> object:
+        if item not in self._level():
+            raise KeyError(item)
+        if len(self.key) < 2:
+            return OccupancyMatrix(self.csp, self.key + (item,))
+        return self.csp.occupant(self.key[0], self.key[1], item)
+
+
+class ClassChoicePoint:
+    """A class on the search stack with a generator of the placements still to be tried, each placement is a
+    (class, period, teacher, classroom) for every class merged with it"""
+    def __init__(self, cls: C, values: Iterator[Tuple[Tuple[C, P, T, R], ...]]) -> None:
+        self.cls = cls
+        self.values = values
+        self.assigned = False  # True while the last value taken from values is assigned
+
+    def __repr__(self) -> str:
+        return "CP:" + str(self.cls)
+
+
 class CSP:
     """Constraint satisfaction framework stores variables, domains and constraints"""
     def __init__(self, classes: List[int], periods: List[int], teachers: List[int], classrooms: List[int]) -> None:
         self.num_backtracks, self.num_assigns = 0, 0
         self.fc, self.mcv = False, False
+        self.ordering: Optional[VariableOrdering[C]] = None  # heap of classes used instead of a random choice
+        self.rng: Optional[Random] = None  # random class choices without an ordering, the random module if None
         self.len_clss = len(classes)
 
         self.classes: List[C] = classes
@@ -39,13 +189,46 @@ class CSP:
         self.prd_domain: Dict[C, List[P]] = {}  # the periods each class can take
         self.tchr_domain: Dict[C, List[T]] = {}  # the teacher each class can take, dependant on subject
         self.clsrm_domain: Dict[C, List[R]] = {}  # the classroom each can take, dependant on subject
-
-        self.tchr_availability: Dict[P, List[T]] = {}  # check which teachers are available at any given time
-        self.clsrm_availability: Dict[P, List[R]] = {}  # check which classrooms are available at any given time
+        self.current_prd_domain: Dict[C, BitsetDomain] = {}  # periods left to each class by forward checking
+        self.trail: List[Tuple[C, int]] = []  # undo log of (class, period bits) for every pruning
+        self.trail_marks = Stack()  # length of the trail when each placement was made
+
+        # resources are bitmasks, bit i of a teacher mask stands for teachers[i] and likewise for classrooms
+        self.tchr_bit: Dict[T, int] = {tchr: 1 << i for i, tchr in enumerate(teachers)}
+        self.clsrm_bit: Dict[R, int] = {clsrm: 1 << i for i, clsrm in enumerate(classrooms)}
+        self.tchr_eligible: Dict[C, int] = {}  # mask of the teachers in the domain of each class
+        self.clsrm_eligible: Dict[C, int] = {}  # mask of the classrooms in the domain of each class
+        self.tchr_availability: Dict[P, int] = {}  # mask of the teachers free in each period
+        self.clsrm_availability: Dict[P, int] = {}  # mask of the classrooms free in each period
+        self.tchr_classes: Dict[T, List[C]] = {}  # classes that can be taught by each teacher
+        self.clsrm_classes: Dict[R, List[C]] = {}  # classes that can be held in each classroom
 
         self.constraints: Dict[C, List[Constraint]] = {}  # constrains classes across all dimensions of the domains
-
-        self.matrix: Dict[P, Dict[T, Dict[R, Optional[C]]]] = {}
+        self.neighbours: Dict[C, Set[C]] = {}  # classes sharing a constraint with each class
+        self.global_constraints: List[GlobalConstraint] = []  # checked as a whole after each placement
+        self.soft_constraints: List[SoftConstraint] = []  # costs to minimise, kept out of constraints
+        self.class_soft_constraints: Dict[C, List[SoftConstraint]] = {}  # soft constraints on each class
+        self.costs: Dict[SoftConstraint, float] = {}  # weighted violations of each soft constraint so far
+        self.cost: float = 0  # total of costs, a lower bound of the cost of any completion of the timetable
+        self.bound: float = float("inf")  # placements reaching this cost are rejected, the best cost found so far
+        self.deadline: Optional[float] = None  # timer() value at which the iterative search pauses
+        self.groups: Dict[C, List[C]] = {}  # classes merged by same period constraints, keyed by the first of them
+        self.representative: Dict[C, C] = {}  # the key in groups of each class
+
+        # occupancy is kept in flat arrays of class indices, -1 where nothing is placed
+        self.cls_index: Dict[C, int] = {cls: i for i, cls in enumerate(classes)}
+        self.indexed_classes: List[C] = list(classes)  # the class of each index, kept if classes is reordered
+        self.prd_index: Dict[P, int] = {prd: i for i, prd in enumerate(periods)}
+        self.tchr_index: Dict[T, int] = {tchr: i for i, tchr in enumerate(teachers)}
+        self.clsrm_index: Dict[R, int] = {clsrm: i for i, clsrm in enumerate(classrooms)}
+        self.tchr_occupancy = array("i")  # class taught by each teacher in each period, periods x teachers
+        self.clsrm_occupancy = array("i")  # class held in each classroom in each period, periods x classrooms
+        self.placements = array("i")  # period, teacher and classroom index of each class
+        self.matrix = OccupancyMatrix(self)
+
+        self.choice_points = Stack()  # search stack of the iterative search, one ClassChoicePoint per placed group
+        self.paused, self.finished = False, False
+        self.stats = SearchStats()  # set stats.enabled to collect search statistics
 
         self._initialise_availability()
         self._initialise_constraints()
@@ -57,53 +240,138 @@ class CSP:
         self.tchr_domain = teachers
         self.clsrm_domain = classrooms
         # check they contain classes as variables
+        self.tchr_classes = {tchr: [] for tchr in self.teachers}
+        self.clsrm_classes = {clsrm: [] for clsrm in self.classrooms}
+        for cls in self.classes:
+            self.tchr_eligible[cls] = self._mask(self.tchr_bit, teachers[cls])
+            self.clsrm_eligible[cls] = self._mask(self.clsrm_bit, classrooms[cls])
+            for tchr in set(teachers[cls]):
+                self.tchr_classes[tchr].append(cls)
+            for clsrm in set(classrooms[cls]):
+                self.clsrm_classes[clsrm].append(cls)
+
+    @staticmethod
+    def _mask(bits: Dict, values: List) -> int:
+        """Returns the mask with the bit of each value set"""
+        mask: int = 0
+        for value in values:
+            if value not in bits:
+                raise LookupError("Every teacher and classroom in a domain should be in the CSP")
+            mask |= bits[value]
+        return mask
+
+    @staticmethod
+    def _unmask(values: List, mask: int) -> List:
+        """Returns the values whose bits are set in mask, in the order of values"""
+        selected: List = []
+        while mask:
+            low: int = mask & -mask
+            selected.append(values[low.bit_length() - 1])
+            mask ^= low
+        return selected
 
     def _initialise_availability(self) -> None:
         """Populates each period with resources available"""
         for period in self.periods:
-            self.tchr_availability[period] = self.teachers
-            self.clsrm_availability[period] = self.classrooms
+            self.tchr_availability[period] = (1 << len(self.teachers)) - 1
+            self.clsrm_availability[period] = (1 << len(self.classrooms)) - 1
 
     def _initialise_constraints(self) -> None:
         """Populates each class with an empty constraint list"""
         for cls in self.classes:
             self.constraints[cls] = []
+            self.neighbours[cls] = set()
 
     def _initialise_matrix(self) -> None:
-        """Populates the 3D matrix with periods x teachers x classrooms"""
-        for prd in self.periods:
-            self.matrix[prd] = {}
-            for tchr in self.teachers:
-                self.matrix[prd][tchr] = {}
-                for clsrm in self.classrooms:
-                    self.matrix[prd][tchr][clsrm] = None
-
-    def _assign(self, cls: C, prd: P, tchr: T, clsrm: R) -> None:
-        """Adds to matrix and discards old value. Bookkeeping for num_assigns"""
+        """Creates the empty occupancy arrays behind the periods x teachers x classrooms matrix"""
+        self.tchr_occupancy = array("i", [-1]) * (len(self.periods) * len(self.teachers))
+        self.clsrm_occupancy = array("i", [-1]) * (len(self.periods) * len(self.classrooms))
+        self.placements = array("i", [-1]) * (3 * len(self.indexed_classes))
+
+    def occupant(self, prd: P, tchr: T, clsrm: R) -> Optional[C]:
+        """Returns the class taught by the teacher in the classroom during the period, None if there is none"""
+        i: int = self.tchr_occupancy[self.prd_index[prd] * len(self.teachers) + self.tchr_index[tchr]]
+        if i == -1 or self.placements[3 * i + 2] != self.clsrm_index[clsrm]:
+            return None
+        return self.indexed_classes[i]
+
+    def _place(self, placements: Tuple[Tuple[C, P, T, R], ...]) -> bool:
+        """Assigns the (class, period, teacher, classroom) of each class in a placement. Returns False if
+        forward checking wipes out a period domain, the prunings are undone together by _backtrack_domains"""
+        if self.fc:
+            self.trail_marks.push(len(self.trail))
+        for cls, prd, tchr, clsrm in placements:
+            if not self._assign(cls, prd, tchr, clsrm):
+                return False
+        return True
+
+    def _assign(self, cls: C, prd: P, tchr: T, clsrm: R) -> bool:
+        """Adds to matrix and discards old value. Bookkeeping for num_assigns.
+        Returns False if forward checking wipes out a period domain"""
         self.num_assigns += 1
-        self.matrix[prd][tchr][clsrm] = cls
+        i, p, t, r = self.cls_index[cls], self.prd_index[prd], self.tchr_index[tchr], self.clsrm_index[clsrm]
+        self.tchr_occupancy[p * len(self.teachers) + t] = i
+        self.clsrm_occupancy[p * len(self.classrooms) + r] = i
+        self.placements[3 * i], self.placements[3 * i + 1], self.placements[3 * i + 2] = p, t, r
         self.assignment[cls] = (prd, tchr, clsrm)
-        self.tchr_availability[prd].remove(tchr)
-        self.clsrm_availability[prd].remove(clsrm)
+        self.tchr_availability[prd] &= ~self.tchr_bit[tchr]
+        self.clsrm_availability[prd] &= ~self.clsrm_bit[clsrm]
+        if cls in self.class_soft_constraints:
+            self._update_costs(cls)
+        if self.stats.enabled:
+            self.stats.node(len(self.assignment), self)
         if self.fc:
-            pass
-            # self._forward_check(cls, prd, tchr, clsrm)
+            if not self.stats.enabled:
+                return self._forward_check(cls, prd, tchr, clsrm)
+            start: float = timer()
+            consistent: bool = self._forward_check(cls, prd, tchr, clsrm)
+            self.stats.propagation_time += timer() - start
+            return consistent
+        return True
 
     def _unassign(self, cls: C) -> None:
         """Backtrack by removing the value set to a variable in assignment"""
+        if cls not in self.assignment:
+            return
         prd, tchr, clsrm = self.assignment[cls]
-        self.matrix[prd][tchr][clsrm] = None
-        self.tchr_availability[prd].append(tchr)
-        self.clsrm_availability[prd].append(clsrm)
+        i, p = self.cls_index[cls], self.prd_index[prd]
+        self.tchr_occupancy[p * len(self.teachers) + self.tchr_index[tchr]] = -1
+        self.clsrm_occupancy[p * len(self.classrooms) + self.clsrm_index[clsrm]] = -1
+        self.placements[3 * i], self.placements[3 * i + 1], self.placements[3 * i + 2] = -1, -1, -1
+        self.tchr_availability[prd] |= self.tchr_bit[tchr]
+        self.clsrm_availability[prd] |= self.clsrm_bit[clsrm]
         del self.assignment[cls]
+        if cls in self.class_soft_constraints:
+            self._update_costs(cls)
+        if self.ordering is not None:
+            self.ordering.touch(self.representative.get(cls, cls))
+
+    def _update_costs(self, cls: C) -> None:
+        """Recounts the soft constraints on a class that has just been placed or removed"""
+        for constraint in self.class_soft_constraints[cls]:
+            cost: float = constraint.weight * constraint.violations(self)
+            self.cost += cost - self.costs[constraint]
+            self.costs[constraint] = cost
+
+    def objective(self) -> float:
+        """Returns the weighted violations of the soft constraints by the current timetable"""
+        return sum(constraint.weight * constraint.violations(self) for constraint in self.soft_constraints)
+
+    def _unassign_group(self, cls: C) -> None:
+        """Removes every class merged into cls"""
+        for class_ in self.groups.get(cls, (cls,)):
+            self._unassign(class_)
 
     def _num_conflicts(self, cls: C, prd: P, tchr: T, clsrm: R) -> int:
         """Return the number of conflicts var=val with other variables already assigned"""
         num_conflicts: int = 0
+        checks = self.stats.checks if self.stats.enabled else None
         for constraint in self.constraints[cls]:
             for class_ in constraint.classes:
                 values: Optional[Tuple[P, T, R]] = self.assignment.get(class_)
                 if values is not None:
+                    if checks is not None:
+                        checks[type(constraint).__name__] += 1
                     if not constraint.satisfied(class_, values[0], values[1], values[2], cls, prd, tchr, clsrm):
                         num_conflicts += 1
         return num_conflicts
@@ -111,26 +379,109 @@ class CSP:
     def _backtrack_domains(self) -> None:
         """Backtrack by removing items of the stack to reflect recursion depth"""
         self.num_backtracks += 1
+        if self.stats.enabled:
+            self.stats.backtrack(self)
         if self.fc:
-            pass
-            # self.current_domains = self.current_domain_stack.pop_item()
+            self._undo_trail(self.trail_marks.pop_item())
+
+    def _prune_periods(self, cls: C, bits: int) -> None:
+        """Removes the periods whose bits are set from the current domain of a class, recording them on the trail"""
+        removed: int = self.current_prd_domain[cls].restrict(~bits)
+        if removed:
+            self.trail.append((cls, removed))
+            if self.stats.enabled:
+                self.stats.prunings += bin(removed).count("1")
+            if self.ordering is not None:
+                self.ordering.touch(self.representative.get(cls, cls))
+
+    def _undo_trail(self, mark: int) -> None:
+        """Restores every period pruned since the trail was at length mark, most recent first"""
+        while len(self.trail) > mark:
+            cls, bits = self.trail.pop()
+            self.current_prd_domain[cls].restore(None, bits)
+            if self.ordering is not None:
+                self.ordering.touch(self.representative.get(cls, cls))
 
     def add_constraint(self, constraint: Constraint) -> None:
         """Adds the constraint to all the variables specified in the constraint"""
+        if isinstance(constraint, SoftConstraint):
+            for cls in constraint.classes:
+                if cls not in self.classes:
+                    raise LookupError("Class in constraint not in CSP")
+                self.class_soft_constraints.setdefault(cls, []).append(constraint)
+            self.soft_constraints.append(constraint)
+            self.costs[constraint] = 0
+            return
         for cls in constraint.classes:
             if cls not in self.classes:
                 raise LookupError("Class in constraint not in CSP")
             else:
                 self.constraints[cls].append(constraint)  # adds the constraint to the variable
-
-    def _forward_check(self) -> None:
-        """Checks each constraint and its variables to see if any of their domains can be reduced"""
-        """for constraint in self.constraints[var]:
-            for variable in constraint.variables:
-                if variable not in assignment:
-                    for value in domains[variable][:]:
-                        if not constraint.satisfied(var, val, variable, value, assignment):
-                            domains[variable].remove(value)"""
+                self.neighbours[cls] |= set(constraint.classes) - {cls}
+        if isinstance(constraint, GlobalConstraint):
+            self.global_constraints.append(constraint)
+
+    def _global_constraints_feasible(self, cls: C = None) -> bool:
+        """Checks the global constraints on the classes merged into cls, or every global constraint if cls is None"""
+        if cls is None:
+            constraints = self.global_constraints
+        else:
+            constraints = [constraint for class_ in self.groups.get(cls, (cls,))
+                           for constraint in self.constraints[class_]]
+        for constraint in constraints:
+            if isinstance(constraint, GlobalConstraint) and not constraint.feasible(self):
+                return False
+        return True
+
+    def _forward_check(self, cls: C, prd: P, tchr: T, clsrm: R) -> bool:
+        """Removes the periods of unplaced classes that conflict with the placement of cls, or in which the
+        placement took the last teacher or classroom they could use. Returns False if a period domain is wiped out"""
+        for other in self.neighbours[cls]:
+            if other in self.assignment:
+                continue
+            domain: BitsetDomain = self.current_prd_domain[other]
+            shared: List[Constraint] = [constraint for constraint in self.constraints[other]
+                                        if cls in constraint.classes]
+            bits: int = 0
+            for prd2 in domain:
+                for constraint in shared:
+                    if not constraint.satisfied(cls, prd, tchr, clsrm, other, prd2, None, None):
+                        bits |= 1 << domain.bit(prd2)
+                        break
+            self._prune_periods(other, bits)
+            if not domain:
+                return self._wipeout(other, cls)
+        tchrs, clsrms = self.tchr_availability[prd], self.clsrm_availability[prd]
+        for others in (self.tchr_classes[tchr], self.clsrm_classes[clsrm]):
+            for other in others:
+                domain = self.current_prd_domain[other]
+                if other in self.assignment or prd not in domain:
+                    continue
+                if not self.tchr_eligible[other] & tchrs or not self.clsrm_eligible[other] & clsrms:
+                    self._prune_periods(other, 1 << domain.bit(prd))
+                    if not domain:
+                        return self._wipeout(other, cls)
+        return True
+
+    def _wipeout(self, cls: C, cause: C) -> bool:
+        """Reports the classes involved in a wiped out period domain to the class ordering, always returns False"""
+        if self.ordering is not None:
+            self.ordering.failure(self.representative.get(cls, cls), self.representative.get(cause, cause))
+        return False
+
+    def _period_domain(self, cls: C) -> Collection[P]:
+        """The periods a class can still take, its current domain while forward checking"""
+        return self.current_prd_domain[cls] if self.fc else self.prd_domain[cls]
+
+    def _initialise_current_domains(self) -> None:
+        """Copies each period domain into a BitsetDomain, classes sharing a domain list share its values"""
+        templates = {}  # keyed by id so one BitsetDomain index is built per distinct domain list
+        self.current_prd_domain = {}
+        for cls in self.classes:
+            periods = self.prd_domain[cls]
+            if id(periods) not in templates:
+                templates[id(periods)] = BitsetDomain(periods)
+            self.current_prd_domain[cls] = templates[id(periods)].copy()
 
     def _check_complete(self) -> bool:
         """Checks if the program is complete by checking if all the classes have been placed"""
@@ -138,52 +489,232 @@ class CSP:
 
     def _select_unassigned_class(self) -> C:
         """Considers which class to try to place into timetable next"""
-        # gets all variables in the CSP but not in the assignment
-        unassigned = [c for c in self.classes if c not in self.assignment.keys()]
-        # fix mcv later
-        if self.mcv:
-            weighted_vars = [(v, self._num_legal_values(v)) for v in unassigned]
-            weighted_vars.sort(key=lambda k: k[1])  # sorts the variables by domain length
-            return weighted_vars[0][0]
-        # selects at class at random if mcv heuristic not specified
-        return choice(unassigned)
+        if self.ordering is not None:  # most constrained class heuristics kept up to date in a heap
+            return self.ordering.select(self.assignment)
+        # gets all the groups of classes in the CSP but not in the assignment
+        unassigned = [c for c in self.groups if c not in self.assignment.keys()]
+        # selects at class at random if no ordering is specified
+        return self.rng.choice(unassigned) if self.rng is not None else choice(unassigned)
 
     def _num_legal_values(self, cls: C) -> tuple:
         """Returns the number of items in each of the domains"""
-        return tuple(map(len, (self.prd_domain[cls], self.tchr_domain[cls], self.clsrm_domain[cls])))
+        return tuple(map(len, (self._period_domain(cls), self.tchr_domain[cls], self.clsrm_domain[cls])))
+
+    def _num_combinations(self, cls: C) -> int:
+        """Returns the number of (period, teacher, classroom) combinations in the domains"""
+        num_prds, num_tchrs, num_clsrms = self._num_legal_values(cls)
+        return num_prds * num_tchrs * num_clsrms
+
+    def _degree(self, cls: C) -> int:
+        """Returns the number of other classes the class shares a constraint with"""
+        return len(self.neighbours[cls])
+
+    def _create_ordering(self, ordering) -> Optional[VariableOrdering[C]]:
+        """Builds the class ordering, mrv compares the domain sizes in order while the others use combinations.
+        The ordering of an earlier search is reused with what it learnt"""
+        if ordering is None:
+            return None
+        neighbours: Dict[C, Set[C]] = {cls: {self.representative[other] for class_ in members
+                                             for other in self.neighbours[class_]} - {cls}
+                                       for cls, members in self.groups.items()}  # between the merged classes
+        if isinstance(ordering, VariableOrdering):
+            ordering.neighbours = neighbours.__getitem__  # the groups are represented by the classes in order
+            ordering.reset(list(self.groups))
+            return ordering
+        size = self._num_legal_values if ordering == "mrv" else self._num_combinations
+        return create_ordering(ordering, list(self.groups), size, self._degree, neighbours.__getitem__)
+
+    def _merge_classes(self) -> None:
+        """Collapses the classes joined by same period constraints into one search variable with union-find,
+        each group is represented by its first class"""
+        sets: DisjointSet[C] = DisjointSet(self.classes)
+        for cls in self.classes:
+            for constraint in self.constraints[cls]:
+                if isinstance(constraint, SamePeriodConstraint):
+                    sets.union(cls, constraint.classes[0])
+        roots: Dict[C, List[C]] = {}
+        for cls in self.classes:
+            roots.setdefault(sets.find(cls), []).append(cls)
+        self.groups = {members[0]: members for members in roots.values()}
+        self.representative = {cls: members[0] for members in roots.values() for cls in members}
 
     def _order_period_values(self, cls: C) -> List[P]:
         """Decides the order in which to try periods"""
-        domain = self.prd_domain[cls][:]
+        domain = list(self._period_domain(cls))  # copied as forward checking edits the live domain
         return domain
 
     def _order_teacher_values(self, cls: C, prd: P) -> List[T]:
-        """Decides the order in which to try teachers"""
-        list1 = self.tchr_domain[cls][:]
-        list2 = self.tchr_availability[prd][:]
-        domain = list(set(list1) & set(list2))
-        return domain
+        """Decides the order in which to try teachers, the eligible teachers free in the period"""
+        return self._unmask(self.teachers, self.tchr_eligible[cls] & self.tchr_availability[prd])
 
     def _order_classroom_values(self, cls: C, prd: P, tchr: T) -> List[R]:
-        """Decides the order in which to try classrooms"""
-        list1 = self.clsrm_domain[cls][:]
-        list2 = self.clsrm_availability[prd][:]
-        domain = list(set(list1) & set(list2))
-        return domain
-
-    def backtracking_search(self, mcv=False, fc=False):
-        """Call point to begin the backtracking search"""
+        """Decides the order in which to try classrooms, the eligible classrooms free in the period"""
+        return self._unmask(self.classrooms, self.clsrm_eligible[cls] & self.clsrm_availability[prd])
+
+    def backtracking_search(self, mcv=False, fc=False, iterative=True, max_nodes=None, ordering=None):
+        """Call point to begin the backtracking search. The iterative search can be paused after
+        max_nodes placements and continued with resume_search. ordering is "mrv", "dom/deg" or "dom/wdeg",
+        or the ordering of an earlier search to keep what it learnt, mcv on its own uses mrv"""
+        if self.stats.enabled:
+            self.stats.reset()
         self.num_backtracks = 0
         self.fc, self.mcv = fc, mcv
-        return self._period_recursive_backtracking()
+        self._clear_search()
+        self._merge_classes()
+        self.ordering = self._create_ordering("mrv" if ordering is None and mcv else ordering)
+        if fc:
+            self._initialise_current_domains()
+            if not all(self.current_prd_domain[cls] and self.tchr_eligible[cls] and self.clsrm_eligible[cls]
+                       for cls in self.classes):  # a class with nothing to choose from
+                return self._finish(None)
+        if not self._global_constraints_feasible():  # infeasible before a single class is placed
+            return self._finish(None)
+        if not iterative:
+            return self._finish(self._period_recursive_backtracking())
+        return self.resume_search(max_nodes)
+
+    def _finish(self, solution: Optional[Dict[C, Tuple[P, T, R]]]) -> Optional[Dict[C, Tuple[P, T, R]]]:
+        """Marks the search as finished and reports it to the statistics, returns solution"""
+        self.finished = True
+        if self.stats.enabled:
+            self.stats.solution(self)
+        return solution
+
+    def _clear_search(self) -> None:
+        """Removes the placements left by a paused search so a new search starts from an empty timetable"""
+        while not self.choice_points.empty():
+            point: ClassChoicePoint = self.choice_points.pop_item()
+            if point.assigned:
+                self._unassign_group(point.cls)
+        self.trail, self.trail_marks = [], Stack()  # the domains are rebuilt by the next search
+        self.paused, self.finished = False, False
+
+    def resume_search(self, max_nodes: int = None) -> Optional[Dict[C, Tuple[P, T, R]]]:
+        """Continues the iterative search from its choice points. Returns None with paused set if
+        max_nodes classes are placed before a solution is found or the search space is exhausted"""
+        if self.finished:
+            return self.assignment if self._check_complete() else None
+        self.paused = False
+        nodes: int = 0
+        while True:
+            if self._check_complete():  # Checks if program is complete
+                return self._finish(self.assignment)
+            cls: C = self._select_unassigned_class()
+            self.choice_points.push(ClassChoicePoint(cls, self._class_values(cls)))
+            if not self._backtrack():
+                return None if self.paused else self._finish(None)
+            nodes += 1
+            if max_nodes is not None and nodes >= max_nodes:
+                self.paused = True
+                return None
+
+    def _backtrack(self) -> bool:
+        """Places the top choice point with its next value, falling back to the previous class each time
+        one runs out of values. Returns False once every choice point has run out, or with paused set once
+        the deadline has passed"""
+        while not self._next_value(self.choice_points.top()):
+            if self.ordering is not None:
+                self.ordering.failure(self.choice_points.top().cls)
+            self.choice_points.pop_item()  # every value failed so falls back to the previous class
+            if self.choice_points.empty():
+                return False
+            if self.deadline is not None and timer() >= self.deadline:
+                self.paused = True
+                return False
+        return True
+
+    def branch_and_bound(self, time_budget: float = None, fc=True, ordering="dom/wdeg",
+                         on_solution: Callable[[Dict[C, Tuple[P, T, R]], float], None] = None
+                         ) -> Optional[Dict[C, Tuple[P, T, R]]]:
+        """Searches for the timetable with the lowest cost of the soft constraints. Each timetable found
+        becomes the bound, so only placements costing less are tried from then on. on_solution(timetable, cost)
+        is called with every improvement. Stops once the search space is exhausted, which proves the last
+        timetable optimal, or once time_budget seconds have passed, with paused set.
+        Returns a copy of the best timetable found, or None, the CSP is left empty"""
+        best: Optional[Dict[C, Tuple[P, T, R]]] = None
+        self.bound = float("inf")
+        self.deadline = None if time_budget is None else timer() + time_budget
+        try:
+            solution = self.backtracking_search(fc=fc, ordering=ordering)
+            while solution is not None:
+                best, self.bound = dict(solution), self.cost
+                if on_solution is not None:
+                    on_solution(best, self.bound)
+                if self.bound <= 0:
+                    break
+                self.finished = False
+                if self.stats.enabled:
+                    self.stats.end_time = None  # the clock runs on to the next timetable
+                if not self._backtrack():  # the timetable just found has to be improved on
+                    break
+                solution = self.resume_search()
+        finally:
+            paused: bool = self.paused
+            self.bound, self.deadline = float("inf"), None
+            self._clear_search()
+            self.paused = paused
+        if self.stats.enabled:
+            self.stats.stop()
+        return best
+
+    def _class_values(self, cls: C) -> Iterator[Tuple[Tuple[C, P, T, R], ...]]:
+        """Yields the placements of the classes merged into cls. Periods are tried first, then the teachers
+        and classrooms of each class in turn, in the order the recursive search tries them"""
+        members: List[C] = self.groups.get(cls, [cls])
+        for prd in self._order_period_values(cls):
+            if all(prd in self._period_domain(class_) and self._num_conflicts(class_, prd, None, None) == 0
+                   for class_ in members):
+                yield from self._member_values(members, prd, [])
+
+    def _member_values(self, members: List[C], prd: P,
+                       placed: List[Tuple[C, P, T, R]]) -> Iterator[Tuple[Tuple[C, P, T, R], ...]]:
+        """Yields the teachers and classrooms of the members not yet in placed, all in period prd"""
+        if len(placed) == len(members):
+            yield tuple(placed)
+            return
+        cls: C = members[len(placed)]
+        for tchr in self._order_teacher_values(cls, prd):
+            if self._num_conflicts(cls, prd, tchr, None) == 0:
+                for clsrm in self._order_classroom_values(cls, prd, tchr):
+                    if self._num_conflicts(cls, prd, tchr, clsrm) == 0 and \
+                            not self._member_conflict(cls, prd, tchr, clsrm, placed):
+                        placed.append((cls, prd, tchr, clsrm))
+                        yield from self._member_values(members, prd, placed)
+                        placed.pop()
+
+    def _member_conflict(self, cls: C, prd: P, tchr: T, clsrm: R, placed: List[Tuple[C, P, T, R]]) -> bool:
+        """Checks a class against the classes of its group placed before it, which are not in assignment yet"""
+        for class_, prd_, tchr_, clsrm_ in placed:
+            if tchr_ == tchr or clsrm_ == clsrm:  # the group shares one period
+                return True
+            for constraint in self.constraints[cls]:
+                if class_ in constraint.classes and \
+                        not constraint.satisfied(class_, prd_, tchr_, clsrm_, cls, prd, tchr, clsrm):
+                    return True
+        return False
+
+    def _next_value(self, point: ClassChoicePoint) -> bool:
+        """Undoes the placement of the choice point and places its classes with the next value, False if none is left"""
+        if point.assigned:
+            self._backtrack_domains()
+            self._unassign_group(point.cls)
+            point.assigned = False
+        for placements in point.values:
+            if self._place(placements) and self._global_constraints_feasible(point.cls) and self.cost < self.bound:
+                point.assigned = True
+                return True
+            self._backtrack_domains()
+            self._unassign_group(point.cls)
+        return False
 
     def _period_recursive_backtracking(self) -> Optional[Dict[C, P]]:
         """Depth-first search which back tracks to the last known decision and chooses a different path"""
-        print(self.assignment)
         if self._check_complete():  # Checks if program is complete
             return self.assignment  # returns solution back down the stack
         # gets every possible domain value of the most constrained unassigned variable
         cls: C = self._select_unassigned_class()
+        if len(self.groups.get(cls, ())) > 1:  # a merged set is placed as a whole
+            return self._group_recursive_backtracking(cls)
         for prd in self._order_period_values(cls):
             if self._num_conflicts(cls, prd, None, None) == 0:  # if still consistent then call next layer
                 result: Optional[Dict[C, P]] = self._teacher_recursive_backtracking(cls, prd)
@@ -191,6 +722,17 @@ class CSP:
                     return result
         return None
 
+    def _group_recursive_backtracking(self, cls) -> Optional[Dict[C, P]]:
+        """Depth-first search over the placements of the classes merged into cls"""
+        for placements in self._class_values(cls):
+            if self._place(placements) and self._global_constraints_feasible(cls):  # skips dead subtrees
+                result: Optional[Dict[C, P]] = self._period_recursive_backtracking()
+                if result is not None:  # if the result is not found, the program will backtrack
+                    return result
+            self._backtrack_domains()
+            self._unassign_group(cls)
+        return None
+
     def _teacher_recursive_backtracking(self, cls, prd) -> Optional[Dict[C, P]]:
         """Depth-first search which back tracks to the last known decision and chooses a different path"""
         for tchr in self._order_teacher_values(cls, prd):
@@ -204,10 +746,11 @@ class CSP:
         """Depth-first search which back tracks to the last known decision and chooses a different path"""
         for clsrm in self._order_classroom_values(cls, prd, tchr):
             if self._num_conflicts(cls, prd, tchr, clsrm) == 0:  # if still consistent then call next layer
-                self._assign(cls, prd, tchr, clsrm)
-                result: Optional[Dict[C, P]] = self._period_recursive_backtracking()
-                if result is not None:  # if the result is not found, the program will backtrack
-                    return result
+                # skips the subtree if a domain is wiped out or a band cannot be completed
+                if self._place(((cls, prd, tchr, clsrm),)) and self._global_constraints_feasible(cls):
+                    result: Optional[Dict[C, P]] = self._period_recursive_backtracking()
+                    if result is not None:  # if the result is not found, the program will backtrack
+                        return result
                 self._backtrack_domains()
             self._unassign(cls)
         return None
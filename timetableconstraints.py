@@ -1,9 +1,11 @@
-from constraintframework import Constraint, CSP, Dict, List, Optional
-from timeit import default_timer as timer
+from constraintframework import Constraint, UnaryConstraint, GlobalConstraint, AllDifferentConstraint, CSP, \
+    BitsetDomain, Dict, List, Optional, Sequence, Tuple
+from collections import Counter
 
 
 class ClassVariable:
-    def __init__(self, sbjt_id, set_num, cls_num, prd_num) -> None:
+    def __init__(self, sbjt_id, set_num, cls_num, prd_num, yr_id=None) -> None:
+        self.yr: Optional[int] = yr_id
         self.sbjt: int = sbjt_id
         self.set_num: int = set_num
         self.cls_num: int = cls_num
@@ -12,8 +14,74 @@ class ClassVariable:
     def __repr__(self):
         return str((self.sbjt, self.set_num, self.cls_num, self.cls_prd_num))
 
+    def lesson_key(self) -> tuple:
+        """The lessons of a class are interchangeable"""
+        return self.yr, self.sbjt, self.set_num, self.cls_num
+
+    def class_key(self) -> Optional[tuple]:
+        """The classes of a set are interchangeable, they are ordered by their first lessons"""
+        return (self.yr, self.sbjt, self.set_num) if self.cls_prd_num == 0 else None
+
+
+class FreePeriodConstraint(UnaryConstraint[ClassVariable, int]):
+    """The period has room for another class, periods maps each period to the classes already placed
+    in it (such as a Periods) and at most capacity classes can run at once"""
+    def __init__(self, classes: List[ClassVariable], periods, capacity: int) -> None:
+        UnaryConstraint.__init__(self, classes)
+        self.periods = periods
+        self.capacity: int = capacity
+
+    def satisfied(self, val1: int) -> bool:
+        return val1 in self.periods and self.periods[val1].num_clss < self.capacity
+
+
+class CapacityConstraint(GlobalConstraint[ClassVariable, int]):
+    """At most capacities[prd] of the classes take each period, such as the classes of a year or the classes
+    sharing the teachers of a subject. A full period is removed from the domains of the classes still to be placed"""
+    static = True  # satisfied never reads the assignment
+    pairwise = False
+    symmetric = True
+    idempotent = True
+
+    def __init__(self, classes: List[ClassVariable], capacities: Dict[int, int]) -> None:
+        GlobalConstraint.__init__(self, classes)
+        self.capacities: Dict[int, int] = capacities
+
+    @classmethod
+    def from_parameters(cls, classes: List[ClassVariable], parameters: Sequence[int]) -> "CapacityConstraint":
+        """Rebuilds the constraint from its parameters as read from the model cache"""
+        return cls(classes, dict(zip(parameters[::2], parameters[1::2])))
+
+    @property
+    def parameters(self) -> Tuple[int, ...]:
+        """Each period followed by its capacity, as written to the model cache"""
+        return tuple(value for item in self.capacities.items() for value in item)
+
+    def satisfied(self, var1, val1, var2, val2, assignment: Dict[ClassVariable, int]) -> bool:
+        return True
+
+    def conflicts(self, var, val, assignment: Dict[ClassVariable, int]) -> List[ClassVariable]:
+        others: List[ClassVariable] = [other for other in self.variables
+                                       if other is not var and other in assignment and assignment[other] == val]
+        return others if len(others) >= self.capacities.get(val, 0) else []
+
+    def propagate(self, csp: CSP[ClassVariable, int], assignment: Dict[ClassVariable, int]) -> bool:
+        counts: Counter = Counter(assignment[var] for var in self.variables if var in assignment)
+        for prd, count in counts.items():
+            capacity: int = self.capacities.get(prd, 0)
+            if count > capacity:
+                return False
+            if count == capacity:
+                for var in self.variables:
+                    if var not in assignment and prd in csp.current_domains[var]:
+                        csp._prune(var, prd)
+        return True
+
 
 class SameSetConstraint(Constraint[ClassVariable, int]):
+    static = True
+    symmetric = True
+
     def __init__(self, classes: List[ClassVariable]) -> None:
         Constraint.__init__(self, classes)
         self.classes: List[ClassVariable] = classes
@@ -46,13 +114,14 @@ def main():
     csp: CSP[str, int] = CSP()
     csp.set_domains(clss, prds)
     csp.add_constraint(SameSetConstraint(clss))
+    csp.break_symmetries(ClassVariable.lesson_key, ClassVariable.class_key)
     print(csp.variables)
     print(csp.domains)
     print(csp.neighbours)
     print(csp.constraints)
-    start = timer()
+    csp.stats.enabled = True
     solution: Optional[Dict[str, int]] = csp.backtracking_search(mcv=True)
-    print(timer()-start)
+    print(csp.stats.report())
     if solution is None:
         print("No solution found!")
     else:
@@ -1,24 +1,17 @@
 from timetableconstraintframework import *
-from timeit import default_timer as timer
 
 
-class SetConstraint(Constraint):
+class SetConstraint(SamePeriodConstraint):
     """Makes sure sets are scheduled at the same time"""
     def __init__(self, classes: List[C]) -> None:
         super().__init__(classes)
 
-    def satisfied(self, cls1, prd1, tchr1, rm1, cls2, prd2, tchr2, rm2) -> bool:
-        return prd1 == prd2
 
-
-class BandConstraint(Constraint):
+class BandConstraint(AllDifferentConstraint):
     """Makes sure classes of the same number cannot be scheduled at the same time"""
     def __init__(self, classes: List[C]) -> None:
         super().__init__(classes)
 
-    def satisfied(self, cls1: C, prd1: P, tchr1: T, rm1: R, cls2: C, prd2: P, tchr2: T, rm2: R) -> bool:
-        return prd1 != prd2
-
 
 class SubjectTeacherConstraint(Constraint):
     """Makes sure classes have the correct subject teacher"""
@@ -30,14 +23,11 @@ class SubjectTeacherConstraint(Constraint):
         return tchr1 in self.teachers
 
 
-class MaxTeacherConstraint(Constraint):
+class MaxTeacherConstraint(AllDifferentConstraint):
     """Teachers cannot teach more than their max number of periods"""
     def __init__(self, classes: List[C]) -> None:
         super().__init__(classes)
 
-    def satisfied(self, cls1: C, prd1: P, tchr1: T, rm1: R, cls2: C, prd2: P, tchr2: T, rm2: R) -> bool:
-        return prd1 != prd2
-
 
 def main():
     classes = [1, 2, 3]
@@ -56,9 +46,9 @@ def main():
     csp.set_domains(period_domains, teacher_domains, classroom_domains)
     csp.add_constraint(SetConstraint([1, 2]))
     csp.add_constraint(BandConstraint([1, 3]))
-    start = timer()
+    csp.stats.enabled = True
     solution: Optional[Dict[str, str]] = csp.backtracking_search()
-    print(timer() - start)
+    print(csp.stats.report())
     if solution is None:
         print("No solution found")
     else:
@@ -1,4 +1,9 @@
 from timetableconstraints import *
+from portfolio import solve_components
+from modelcache import ModelCache, model_key
+from constraintframework import LessEqualConstraint
+from typing import Callable, Iterator, Tuple
+from array import array
 from abc import abstractmethod
 from database import MainDatabase
 from math import ceil
@@ -8,12 +13,16 @@ from pprint import pprint
 
 class Entity:
     """Represents any item within the database that has PK"""
+    __slots__ = ("id", "type")
+
     def __init__(self, id_: int, type_: str) -> None:
         self.id: int = id_
         self.type: str = type_
 
 
 class Year(Entity):
+    __slots__ = ("subjects", "prd_clss", "num_clss", "option")
+
     def __init__(self, id_: int, option: bool) -> None:
         super().__init__(id_, "Y")
         self.subjects: Subjects = Subjects()
@@ -28,6 +37,8 @@ class Years(dict):
 
 
 class Subject(Entity):
+    __slots__ = ("req_prds", "num_tchrs", "sbjt_prds", "clss_distribution")
+
     def __init__(self, id_: int, req_prds: int, num_tchrs: int) -> None:
         super().__init__(id_, "Sj")
         self.req_prds = req_prds
@@ -42,17 +53,63 @@ class Subjects(dict):
 
 
 class Period(Entity):
+    __slots__ = ("num_clss",)
+
     def __init__(self, id_: int, num_clss: int) -> None:
         super().__init__(id_, "P")
         self.num_clss = num_clss
 
 
-class Periods(dict):
-    def __init__(self: Dict[int, Period]) -> None:
-        super().__init__()
+class Periods:
+    """Number of classes in each period, kept as an array of counts over an index of the period ids which
+    can be shared by many Periods. Reads like a dict of Period, each Period returned is a copy so counts
+    are changed by setting a Period"""
+    __slots__ = ("index", "counts")
+
+    def __init__(self, index: Dict[int, int] = None, counts: array = None) -> None:
+        self.index: Dict[int, int] = index if index is not None else {}  # position of each period id in counts
+        self.counts: array = counts if counts is not None else array("i", [0]) * len(self.index)
+
+    @classmethod
+    def from_counts(cls, index: Dict[int, int], counts: Dict[int, int]) -> "Periods":
+        """Returns the periods of index with the given counts, periods missing from counts have none"""
+        return cls(index, array("i", [counts.get(prd, 0) for prd in index]))
+
+    def __repr__(self) -> str:
+        return "Periods(" + str(dict(zip(self.index, self.counts))) + ")"
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, prd: int) -> bool:
+        return prd in self.index
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.index)
+
+    def __getitem__(self, prd: int) -> Period:
+        return Period(prd, self.counts[self.index[prd]])
+
+    def __setitem__(self, prd: int, period: Period) -> None:
+        if prd not in self.index:
+            self.index = dict(self.index)  # copied as the index may be shared
+            self.index[prd] = len(self.counts)
+            self.counts.append(0)
+        self.counts[self.index[prd]] = period.num_clss
+
+    def keys(self) -> Iterator[int]:
+        return iter(self.index)
+
+    def values(self) -> Iterator[Period]:
+        return (Period(prd, num_clss) for prd, num_clss in zip(self.index, self.counts))
+
+    def items(self) -> Iterator[Tuple[int, Period]]:
+        return ((prd, Period(prd, num_clss)) for prd, num_clss in zip(self.index, self.counts))
 
 
 class SubjectsEntity(Entity):
+    __slots__ = ("subjects",)
+
     def __init__(self, id_: int, type_: str):
         super().__init__(id_, type_)
         self.subjects: List[Entity] = []
@@ -77,6 +134,8 @@ class Classrooms:
 
 
 class Class(Entity):
+    __slots__ = ("students", "subject", "num_prds", "teacher", "classroom")
+
     def __init__(self, id_: int, sbjt_id: int) -> None:
         super().__init__(id_, "Cl")
         self.students: List[Entity] = []
@@ -110,72 +169,203 @@ class CSPManager:
 
     def configure_curriculum_csp(self):
         self.curriculum_csp.config_data()
-        self.curriculum_csp.config_csp()
+        solution = self.curriculum_csp.config_csp()
+        if solution is not None:
+            self.curriculum_csp.save_solution(solution)
+
+    def repair_curriculum_csp(self):
+        self.curriculum_csp.config_data()
+        solution = self.curriculum_csp.repair_csp()
+        if solution is not None:
+            self.curriculum_csp.save_solution(solution, self.curriculum_csp.load_solution())
 
 
 class CurriculumCSP(CSP):
-    def __init__(self, database) -> None:
-        super().__init__()
+    # part of the model cache key, bump it whenever _set_variables changes the variables or constraints it builds
+    MODEL_VERSION = 3
+
+    def __init__(self, database, domain_type: type = BitsetDomain) -> None:
+        super().__init__(domain_type)
         self.db: MainDatabase = database
         self.error_log = []
         self.years: Years = Years()
+        self.periods: List[int] = []  # the Period_IDs of the period grid
+
+    def __getstate__(self) -> dict:
+        """The database connection cannot be pickled, so it is left out when the CSP is sent to another process"""
+        state = self.__dict__.copy()
+        state["db"] = None
+        return state
 
     def config_data(self) -> None:
         """Updates data from database"""
         self._set_years()
 
-    def config_csp(self) -> None:
-        """Updates CSP to match the data"""
-        # insert for loop here for each year
-        yr: Year = self.years[1]
+    def config_csp(self, processes: int = None, on_progress: Callable = None) -> Optional[Dict[ClassVariable, int]]:
+        """Updates CSP to match the data, then solves the parts of it that share no constraint concurrently,
+        calling on_progress with the number of lessons placed and of nodes searched as the searches go on.
+        Statistics are collected in stats if the caller has enabled it. Returns the merged solution, or None if
+        a part has none"""
+        self._build_model(ClassVariable.lesson_key, ClassVariable.class_key)
+        return solve_components(self, processes, on_progress, fc=True, ordering="dom/wdeg")
+
+    def repair_csp(self) -> Optional[Dict[ClassVariable, int]]:
+        """Updates CSP to match the data, then re-solves it starting from the placements in class_placement,
+        moving as few lessons as possible. Classes of a set are not ordered, as that could move placed classes.
+        Statistics are collected in stats if the caller has enabled it. Returns the solution, or None if there is
+        none"""
+        self._build_model(ClassVariable.lesson_key)
+        return self.repair(self.load_solution(), fc=True, ordering="dom/wdeg")
+
+    def _build_model(self, *symmetry_keys) -> None:
+        """Sets the variables, domains and compiled constraints, read from the model cache next to the database
+        if it was built from the same data before"""
+        if self.domain_type is not BitsetDomain or self.db is None or self.db.filepath is None:
+            self._set_variables(*symmetry_keys)
+            return
+        cache: ModelCache = ModelCache(self.db.local_filepath(),
+                                       lambda var: (var.sbjt, var.set_num, var.cls_num, var.cls_prd_num, var.yr),
+                                       ClassVariable, (AllDifferentConstraint, LessEqualConstraint, CapacityConstraint))
+        key: str = model_key(self.MODEL_VERSION, self._model_inputs())
+        variant: str = "-".join(symmetry_key.__name__ for symmetry_key in symmetry_keys) or "none"
+        if not cache.load(self, key, variant):
+            self._set_variables(*symmetry_keys)
+            self.compile_constraints()
+            cache.save(self, key, variant)
+
+    def _model_inputs(self) -> tuple:
+        """The data the variables and domains are built from, the model cache is keyed by its digest"""
+        return tuple(self.periods), tuple((yr.id, yr.num_clss, tuple(yr.prd_clss.counts),
+                                           tuple((sbjt.id, sbjt.req_prds, sbjt.num_tchrs, sbjt.clss_distribution,
+                                                  tuple(sbjt.sbjt_prds.counts)) for sbjt in yr.subjects.values()))
+                                          for yr in self.years.values())
+
+    def _set_variables(self, *symmetry_keys) -> None:
+        """Sets a variable for every lesson of every class in each year, interchangeable variables are
+        ordered by the symmetry keys. A lesson can take any period of the grid in which neither its year nor
+        its subject is already full, and no period is given more lessons than its year has room for or than
+        there are teachers of a subject left over all years"""
         classes: List[ClassVariable] = []
-        domains: Dict[ClassVariable, List[int]] = {}
-        domain: List[int] = list(range(1, 50 * yr.num_clss + 1))
-        for sbjt in yr.subjects.values():
-            for num, set_ in enumerate(sbjt.clss_distribution, 1):
-                for cls in range(set_):
-                    for prd in range(sbjt.req_prds):
-                        classes.append(ClassVariable(sbjt.id, num, cls, prd))
-                        domains[classes[-1]] = domain
+        domains: Dict[ClassVariable, Tuple[int, ...]] = {}
+        lessons: List[List[ClassVariable]] = []
+        shared: Dict[Tuple[int, ...], Tuple[int, ...]] = {}  # equal domains are one tuple, so one bitset index
+        limits: List[Tuple[Periods, int, List[ClassVariable]]] = []  # lessons sharing a limit on each period
+        sbjt_limits: Dict[int, Tuple[Periods, int, List[ClassVariable]]] = {}  # a subject's teachers serve every year
+        for yr in self.years.values():
+            limits.append((yr.prd_clss, yr.num_clss, []))
+            yr_limit: Tuple[Periods, int, List[ClassVariable]] = limits[-1]
+            for sbjt in yr.subjects.values():
+                if sbjt.id not in sbjt_limits:
+                    sbjt_limits[sbjt.id] = (sbjt.sbjt_prds, sbjt.num_tchrs, [])
+                    limits.append(sbjt_limits[sbjt.id])
+                sbjt_classes: List[ClassVariable] = []
+                for num, set_ in enumerate(sbjt.clss_distribution, 1):
+                    for cls in range(set_):
+                        lessons.append([])
+                        for prd in range(sbjt.req_prds):
+                            sbjt_classes.append(ClassVariable(sbjt.id, num, cls, prd, yr.id))
+                            lessons[-1].append(sbjt_classes[-1])
+                domain: Tuple[int, ...] = self.prefilter(self.periods, [
+                    FreePeriodConstraint(sbjt_classes, yr.prd_clss, yr.num_clss),
+                    FreePeriodConstraint(sbjt_classes, sbjt.sbjt_prds, sbjt.num_tchrs)])
+                domain = shared.setdefault(domain, domain)
+                for cls in sbjt_classes:
+                    domains[cls] = domain
+                classes += sbjt_classes
+                yr_limit[2].extend(sbjt_classes)
+                sbjt_limits[sbjt.id][2].extend(sbjt_classes)
         self.set_domains(classes, domains)
-        start = timer()
-        solution = self.backtracking_search()
-        print(timer()-start)
-        print(solution)
+        # before the constraints of each class, which swapping the first lessons of two classes does not preserve
+        self.break_symmetries(*symmetry_keys)
+        for cls_lessons in lessons:  # a class_placement row is keyed by its period and class
+            if len(cls_lessons) > 1:
+                self.add_constraint(AllDifferentConstraint(cls_lessons))
+        for prd_clss, num_clss, limited in limits:  # their scopes join the sets sharing a year or teachers
+            room: Dict[int, int] = {prd: num_clss - period.num_clss for prd, period in prd_clss.items()}
+            if len(limited) > min(room.values(), default=0):  # otherwise no period can be overfilled
+                self.add_constraint(CapacityConstraint(limited, room))
+
+    def _class_ids(self) -> Dict[tuple, List[int]]:
+        """Returns the Class_IDs of each set keyed by year, subject and set number"""
+        set_classes: Dict[tuple, List[int]] = {}
+        for yr_id, sbjt_id, set_num, cls_id in self.db.get_set_classes():
+            set_classes.setdefault((yr_id, sbjt_id, set_num), []).append(cls_id)
+        return set_classes
+
+    def load_solution(self) -> Dict[ClassVariable, int]:
+        """Returns the periods in class_placement as an assignment of the variables, the lessons of a class
+        take its periods in order. Classes that are not in a set or not placed are left out"""
+        periods: Dict[int, List[int]] = {}
+        for cls_id, prd in self.db.get_class_placements():
+            periods.setdefault(cls_id, []).append(prd)
+        set_classes: Dict[tuple, List[int]] = self._class_ids()
+        solution: Dict[ClassVariable, int] = {}
+        for var in self.variables:
+            cls_ids: List[int] = set_classes.get((var.yr, var.sbjt, var.set_num), [])
+            if var.cls_num < len(cls_ids) and var.cls_prd_num < len(periods.get(cls_ids[var.cls_num], [])):
+                solution[var] = periods[cls_ids[var.cls_num]][var.cls_prd_num]
+        return solution
+
+    def save_solution(self, solution: Dict[ClassVariable, int], previous: Dict[ClassVariable, int] = None) -> None:
+        """Writes the periods of the solution to class_placement in one transaction. Only the lessons whose
+        period changed are written, the lessons a class keeps stay with their teachers and classrooms. Given
+        the previous solution, only classes with a lesson that moved are compared with class_placement. The
+        classes must already have been created in their sets, and every period must be a Period_ID of the grid
+        read by config_data"""
+        grid: set = set(self.periods)
+        for var, prd in solution.items():
+            if prd not in grid:
+                raise ValueError("Period %s of %s in year %s is not in the period grid" % (prd, var, var.yr))
+        set_classes: Dict[tuple, List[int]] = self._class_ids()
+        periods: Dict[int, set] = {}  # the periods of each class in the solution
+        moved: set = set()
+        for var, prd in solution.items():
+            try:
+                cls_id: int = set_classes[(var.yr, var.sbjt, var.set_num)][var.cls_num]
+            except (KeyError, IndexError):
+                raise LookupError("No class has been created for %s in year %s" % (var, var.yr))
+            periods.setdefault(cls_id, set()).add(prd)
+            if previous is None or previous.get(var) != prd:
+                moved.add(cls_id)
+        placed: Dict[int, set] = {cls_id: set() for cls_id in moved}  # the periods of each class in class_placement
+        for cls_id, prd in self.db.get_class_placements():
+            if cls_id in placed:
+                placed[cls_id].add(prd)
+        self.db.move_class_placements(
+            [(prd, cls_id) for cls_id in sorted(moved) for prd in sorted(placed[cls_id] - periods[cls_id])],
+            [(prd, cls_id, None, None) for cls_id in sorted(moved) for prd in sorted(periods[cls_id] - placed[cls_id])])
 
     def _set_years(self) -> None:
-        """Instantiates the year class for each year"""
-        for yr in self.db.get_all_year_data():
+        """Instantiates the year class for each year from a single snapshot of the database"""
+        snapshot: dict = self.db.get_curriculum_snapshot()
+        ideal_class_size: int = round(stats.mean(snapshot["classroom_sizes"]))
+        num_students: Dict[int, int] = dict(snapshot["num_students"])
+        self.periods = snapshot["periods"]
+        index: Dict[int, int] = {prd: i for i, prd in enumerate(self.periods)}  # shared by every Periods
+        year_prds: Dict[int, Dict[int, int]] = self._period_counts(snapshot["year_period_classes"])
+        sbjt_prds: Dict[int, Dict[int, int]] = self._period_counts(snapshot["subject_period_classes"])
+        subject_periods: Dict[int, Periods] = {}  # the same for a subject in every year, so built once
+        for yr in snapshot["years"]:
             year: Year = Year(yr[0], bool(yr[3]))
-            year.num_clss = self._get_num_clss(yr[0])
-            self._set_num_clss_prds(year)
-            self._set_subjects(year)
+            year.num_clss = ceil(num_students.get(yr[0], 0) / ideal_class_size)
+            year.prd_clss = Periods.from_counts(index, year_prds.get(yr[0], {}))
             self.years[yr[0]] = year
-
-    def _get_num_clss(self, yr_id: int) -> int:
-        """Calculates the number of classes needed in that particular year"""
-        ideal_class_size = round(stats.mean(self.db.get_classroom_sizes()))
-        num_students = len(self.db.get_students_in_year(yr_id))
-        return ceil(num_students/ideal_class_size)
-
-    def _set_num_clss_prds(self, year: Year) -> None:
-        """Sets periods: Dict[id, Period] to the existing classes during each period of that year"""
-        for prd in self.db.get_num_yr_clss_prd(year.id):
-            year.prd_clss[prd[0]] = Period(*prd)
-
-    def _set_subjects(self, year: Year) -> None:
-        """Sets subjects: Dict[id, Subject] to the subjects in each year"""
-        for sbjt in self.db.get_subject_teachers(year.id):
+        for yr_id, *sbjt in snapshot["subject_teachers"]:
+            year = self.years[yr_id]
             subject: Subject = Subject(*sbjt)
-            self._set_num_sbjt_prds(year, subject)
+            if sbjt[0] not in subject_periods:
+                subject_periods[sbjt[0]] = Periods.from_counts(index, sbjt_prds.get(sbjt[0], {}))
+            subject.sbjt_prds = subject_periods[sbjt[0]]
             self._set_req_clss(year.num_clss, subject)
             year.subjects[sbjt[0]] = subject
-            # pprint(vars(subject))
 
-    def _set_num_sbjt_prds(self, year: Year, subject: Subject) -> None:
-        """Sets periods: Dict[id, Period] to the existing classes for each subject"""
-        for prd in self.db.get_num_sbjt_clss_prd(year.id):
-            subject.sbjt_prds[prd[0]] = Period(*prd)
+    @staticmethod
+    def _period_counts(rows: List[tuple]) -> Dict[int, Dict[int, int]]:
+        """Groups rows of (key, period, number of classes) into the counts of each key"""
+        counts: Dict[int, Dict[int, int]] = {}
+        for key, prd, num_clss in rows:
+            counts.setdefault(key, {})[prd] = num_clss
+        return counts
 
     def _set_req_clss(self, num_clss: int, subject: Subject) -> None:
         """Sets the required number of classes"""
@@ -209,4 +399,6 @@ class CurriculumCSP(CSP):
 if __name__ == '__main__':
     main_database = MainDatabase("Main Database")
     csp_manager = CSPManager(main_database)
+    csp_manager.curriculum_csp.stats.enabled = True
     csp_manager.configure_curriculum_csp()
+    print(csp_manager.curriculum_csp.stats.report())
@@ -0,0 +1,171 @@
+from typing import Dict, List, Optional, Tuple
+from collections import Counter
+import multiprocessing as mp
+import constraintframework as cf
+import timetableconstraintframework as tcf
+from matching import hopcroft_karp, hall_violator
+
+
+class PeriodConstraint(cf.Constraint):
+    """A timetable constraint that only compares periods, checked on the periods of the first phase"""
+    static = True
+
+    def __init__(self, constraint: tcf.Constraint) -> None:
+        super().__init__(list(constraint.classes))
+        self.constraint = constraint
+        self.scope = set(constraint.classes)
+
+    def satisfied(self, var1, val1, var2, val2, assignment: Dict) -> bool:
+        return var2 not in self.scope or self.constraint.satisfied(var2, val2, None, None, var1, val1, None, None)
+
+
+class PeriodCapacityConstraint(cf.GlobalConstraint):
+    """No period holds more classes than there are teachers or classrooms. A full period is removed
+    from the domains of the classes still to be placed"""
+    pairwise = False
+    symmetric = True
+
+    def __init__(self, classes: List, capacity: int) -> None:
+        super().__init__(classes)
+        self.capacity = capacity
+
+    def satisfied(self, var1, val1, var2, val2, assignment: Dict) -> bool:
+        return True
+
+    def conflicts(self, var, val, assignment: Dict) -> List:
+        others: List = [other for other in self.variables if other != var and other in assignment
+                        and assignment[other] == val]
+        return others if len(others) >= self.capacity else []
+
+    def propagate(self, csp: cf.CSP, assignment: Dict) -> bool:
+        counts: Counter = Counter(assignment[var] for var in self.variables if var in assignment)
+        for prd, count in counts.items():
+            if count > self.capacity:
+                return False
+            if count == self.capacity:
+                for var in self.variables:
+                    if var not in assignment and prd in csp.current_domains[var]:
+                        csp._prune(var, prd)
+        return True
+
+
+class PeriodNogood(cf.GlobalConstraint):
+    """The classes cannot all take the same period, learnt from a set of classes that share too few
+    teachers or classrooms to be matched. Their teachers and classrooms are the same in every period,
+    so the set cannot be matched in any of them"""
+    pairwise = False
+    symmetric = True
+
+    def __init__(self, classes: List) -> None:
+        super().__init__(classes)
+
+    def satisfied(self, var1, val1, var2, val2, assignment: Dict) -> bool:
+        return True
+
+    def conflicts(self, var, val, assignment: Dict) -> List:
+        others: List = [other for other in self.variables if other != var]
+        return others if all(other in assignment and assignment[other] == val for other in others) else []
+
+    def propagate(self, csp: cf.CSP, assignment: Dict) -> bool:
+        periods: set = {assignment[var] for var in self.variables if var in assignment}
+        if len(periods) > 1:
+            return True
+        outside: List = [var for var in self.variables if var not in assignment]
+        if not outside:
+            return False
+        if len(outside) == 1 and periods:
+            prd = next(iter(periods))
+            if prd in csp.current_domains[outside[0]]:
+                csp._prune(outside[0], prd)  # the last class cannot join the others
+        return True
+
+
+class RepairLimitError(RuntimeError):
+    """Raised when the two phase solver runs out of repairs, which does not mean there is no solution"""
+
+
+def period_csp(csp: tcf.CSP) -> cf.CSP:
+    """Builds the first phase, a CSP placing every class of a timetable CSP into a period"""
+    periods: cf.CSP = cf.CSP(cf.BitsetDomain)
+    periods.set_domains(list(csp.classes), {cls: csp.prd_domain[cls] for cls in csp.classes})
+    added: set = set()
+    for cls in csp.classes:
+        for constraint in csp.constraints[cls]:
+            if id(constraint) in added:
+                continue
+            added.add(id(constraint))
+            if not constraint.periods_only:
+                raise ValueError("The two phase solver only supports constraints that compare periods, not %s"
+                                 % type(constraint).__name__)
+            if isinstance(constraint, tcf.AllDifferentConstraint):
+                periods.add_constraint(cf.AllDifferentConstraint(list(constraint.classes)))
+            else:
+                periods.add_constraint(PeriodConstraint(constraint))
+    capacity: int = min(len(csp.teachers), len(csp.classrooms))
+    periods.add_constraint(PeriodCapacityConstraint(list(csp.classes), capacity))
+    return periods
+
+
+def _match_period(job: tuple) -> Tuple[object, Dict, Dict, List]:
+    """Matches the classes of one period to teachers and to classrooms. Returns the period, both
+    matchings and the classes that cannot all be matched, which is empty if both matchings are complete"""
+    prd, teachers, classrooms = job
+    tchr_matching: Dict = hopcroft_karp(teachers)
+    if len(tchr_matching) < len(teachers):
+        return prd, tchr_matching, {}, hall_violator(teachers, tchr_matching)
+    clsrm_matching: Dict = hopcroft_karp(classrooms)
+    if len(clsrm_matching) < len(classrooms):
+        return prd, tchr_matching, clsrm_matching, hall_violator(classrooms, clsrm_matching)
+    return prd, tchr_matching, clsrm_matching, []
+
+
+def solve_two_phase(csp: tcf.CSP, processes: int = 1, max_repairs: int = 1000,
+                    ordering: str = "dom/wdeg") -> Optional[Dict]:
+    """Solves a timetable CSP in two phases. Classes are first placed into periods with forward checking
+    and period capacities, then the classes of each period are matched to teachers and classrooms with
+    Hopcroft-Karp. The matchings are small, so they run in this process unless processes asks for a pool
+    (None for one process per CPU). A failed matching is repaired by learning that the classes that
+    cannot be matched may not share any period and placing the periods again, up to max_repairs times.
+    The solution is placed into csp as if its own search had found it, returns None if there is none.
+    Raises RepairLimitError if max_repairs runs out"""
+    periods: cf.CSP = period_csp(csp)
+    pool = mp.Pool(processes) if processes != 1 else None
+    try:
+        for repair in range(max_repairs + 1):
+            placement: Optional[Dict] = periods.backtracking_search(fc=True, ordering=ordering)
+            if placement is None:
+                return None
+            by_period: Dict[object, List] = {}
+            for cls, prd in placement.items():
+                by_period.setdefault(prd, []).append(cls)
+            jobs: List[tuple] = [(prd, {cls: csp.tchr_domain[cls] for cls in classes},
+                                  {cls: csp.clsrm_domain[cls] for cls in classes})
+                                 for prd, classes in by_period.items()]
+            results: List[tuple] = list((pool.map if pool is not None else map)(_match_period, jobs))
+            failed: List[tuple] = [(prd, violator) for prd, _, _, violator in results if violator]
+            if not failed:
+                _place_solution(csp, results)
+                return csp.assignment
+            for prd, violator in failed:
+                periods.add_constraint(PeriodNogood(violator))
+        raise RepairLimitError("No timetable found within %d repairs" % max_repairs)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+def _place_solution(csp: tcf.CSP, results: List[tuple]) -> None:
+    """Replaces any placements in csp with the matched periods, teachers and classrooms"""
+    csp._clear_search()
+    for cls in list(csp.assignment):  # left by a recursive search
+        csp._unassign(cls)
+    csp.fc, csp.ordering = False, None
+    for prd, tchr_matching, clsrm_matching, _ in results:
+        for cls, tchr in tchr_matching.items():
+            csp._assign(cls, prd, tchr, clsrm_matching[cls])
+    csp.paused, csp.finished = False, True
+
+
+if __name__ == '__main__':
+    pass
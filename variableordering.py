@@ -0,0 +1,162 @@
+from typing import Generic, TypeVar, Callable, Collection, Dict, FrozenSet, List, Set, Tuple, Container, Optional
+from abc import ABC, abstractmethod
+from heapq import heappush, heappop, heapify
+
+V = TypeVar("V")
+
+
+class VariableOrdering(Generic[V], ABC):
+    """Keeps the variables in a heap keyed by a heuristic score, lowest score is selected first.
+    Entries are refreshed lazily, so a domain change only costs a push when the next variable is selected"""
+    def __init__(self, variables: List[V], size: Callable[[V], object], degree: Callable[[V], int],
+                 neighbours: Callable[[V], Collection[V]] = None) -> None:
+        self.size = size  # current domain size of a variable
+        self.degree = degree  # number of variables constrained with a variable
+        self.neighbours = neighbours  # set of the variables constrained with a variable
+        self.reset(variables)
+
+    def reset(self, variables: List[V]) -> None:
+        """Prepares the ordering for a new search over variables, anything learnt by earlier searches is kept"""
+        self.position: Dict[V, int] = {var: i for i, var in enumerate(variables)}  # ties keep the variable order
+        self.keys: Dict[V, object] = {}  # key of the live heap entry of each variable, other entries are stale
+        self.heap: List[Tuple[object, int, V]] = []
+        self.dirty: Set[V] = set(variables)  # variables whose key may have changed since the last selection
+
+    def __repr__(self) -> str:
+        return type(self).__name__ + ":" + str(len(self.keys))
+
+    @abstractmethod
+    def key(self, var: V) -> object:
+        """Needs to be overwritten to score a variable"""
+        ...
+
+    def touch(self, var: V) -> None:
+        """Marks the variable as changed, either its domain changed or it has been unassigned"""
+        self.dirty.add(var)
+
+    def failure(self, *variables: V) -> None:
+        """Called with the variables involved in a dead end, used by learning heuristics"""
+
+    def select(self, assignment: Container[V]) -> Optional[V]:
+        """Returns the unassigned variable with the lowest key"""
+        for var in self.dirty:
+            key = self.key(var)
+            if self.keys.get(var) != key:
+                self.keys[var] = key
+                heappush(self.heap, (key, self.position[var], var))
+        self.dirty.clear()
+        if len(self.heap) > 4 * len(self.position) + 64:  # drops stale entries once they dominate the heap
+            self.heap = [(key, pos, var) for key, pos, var in self.heap if self.keys.get(var) == key]
+            heapify(self.heap)
+        while self.heap:
+            key, pos, var = self.heap[0]
+            if self.keys.get(var) != key:  # stale entry
+                heappop(self.heap)
+            elif var in assignment:  # pushed again by touch when it is unassigned
+                heappop(self.heap)
+                del self.keys[var]
+            else:
+                return var
+        return None
+
+
+class MRVOrdering(VariableOrdering[V]):
+    """Minimum remaining values, the variable with the smallest domain"""
+    def key(self, var: V) -> object:
+        return self.size(var)
+
+
+class DomDegOrdering(VariableOrdering[V]):
+    """Smallest ratio of domain size to the number of constrained variables"""
+    def key(self, var: V) -> float:
+        return self.size(var) / max(self.degree(var), 1)
+
+
+class DomWDegOrdering(VariableOrdering[V]):
+    """Smallest ratio of domain size to weighted degree. Every constraint starts with weight 1 and gains 1 each
+    time it causes a dead end, the weighted degree of a variable sums the weights of its constraints that still
+    have another unassigned variable. The constraints are the arcs to the neighbours and any other variables
+    passed together to failure, such as those of a global constraint"""
+    def __init__(self, variables: List[V], size: Callable[[V], object], degree: Callable[[V], int],
+                 neighbours: Callable[[V], Collection[V]] = None) -> None:
+        if neighbours is None:
+            raise ValueError("dom/wdeg needs the neighbours of each variable")
+        self.arc_weights: Dict[V, Dict[V, int]] = {}  # failures of the arc to each neighbour, on top of 1
+        self.weights: Dict[FrozenSet[V], int] = {}  # failures of the other constraints, which start at 0
+        self.scopes: Dict[V, List[FrozenSet[V]]] = {}  # the other constraints containing each variable
+        super().__init__(variables, size, degree, neighbours)
+
+    def reset(self, variables: List[V]) -> None:
+        """Keeps the weights learnt by earlier searches, such as the runs of a restarting search"""
+        super().reset(variables)
+        self.assignment: Container[V] = ()
+        self.assigned: Set[V] = set()  # variables seen assigned, so an unassignment can be told apart from a pruning
+        self.pending: Set[V] = set()  # variables selected or unassigned since the last selection, maybe assigned since
+
+    def key(self, var: V) -> float:
+        assignment = self.assignment
+        arcs: Dict[V, int] = self.arc_weights.get(var, {})
+        wdeg: int = 0
+        for other in self.neighbours(var):
+            if other not in assignment:
+                wdeg += 1 + arcs.get(other, 0)
+        for scope in self.scopes.get(var, ()):
+            if len(scope) == 1 or any(other not in assignment for other in scope if other != var):
+                wdeg += self.weights[scope]
+        return self.size(var) / wdeg if wdeg else float("inf")
+
+    def touch(self, var: V) -> None:
+        self.dirty.add(var)
+        if var in self.assigned and var not in self.assignment:  # unassigned rather than pruned
+            self.assigned.discard(var)
+            self.pending.add(var)
+            self._touch_partners(var)
+
+    def select(self, assignment: Container[V]) -> Optional[V]:
+        self.assignment = assignment
+        for var in self.pending:
+            if var in assignment:
+                self.assigned.add(var)
+                self._touch_partners(var)
+        self.pending.clear()
+        selected: Optional[V] = super().select(assignment)
+        if selected is not None:
+            self.pending.add(selected)
+        return selected
+
+    def _touch_partners(self, var: V) -> None:
+        """Marks the variables whose weighted degree changes when var is assigned or unassigned"""
+        self.dirty.update(self.neighbours(var))
+        for scope in self.scopes.get(var, ()):  # only counts for a variable while another one is unassigned
+            unassigned: List[V] = [other for other in scope if other != var and other not in self.assignment]
+            if len(unassigned) == 1:
+                self.dirty.add(unassigned[0])
+
+    def failure(self, *variables: V) -> None:
+        if len(variables) == 2 and variables[1] in self.neighbours(variables[0]):
+            a, c = variables
+            weight: int = self.arc_weights.get(a, {}).get(c, 0) + 1
+            self.arc_weights.setdefault(a, {})[c] = self.arc_weights.setdefault(c, {})[a] = weight
+        else:
+            scope: FrozenSet[V] = frozenset(variables)
+            if scope not in self.weights:
+                self.weights[scope] = 0
+                for var in scope:
+                    self.scopes.setdefault(var, []).append(scope)
+            self.weights[scope] += 1
+        self.dirty.update(variables)
+
+
+ORDERINGS: Dict[str, type] = {"mrv": MRVOrdering, "dom/deg": DomDegOrdering, "dom/wdeg": DomWDegOrdering}
+
+
+def create_ordering(name: str, variables: List[V], size: Callable[[V], object], degree: Callable[[V], int],
+                    neighbours: Callable[[V], Collection[V]] = None) -> VariableOrdering[V]:
+    """Instantiates the ordering registered under name"""
+    if name not in ORDERINGS:
+        raise LookupError("Unknown variable ordering '%s', expected one of %s" % (name, ", ".join(ORDERINGS)))
+    return ORDERINGS[name](variables, size, degree, neighbours)
+
+
+if __name__ == '__main__':
+    pass